@@ -0,0 +1,152 @@
+import time
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+from rest_framework.response import Response
+
+from .replicas import primary_if_changed
+
+VERSION_PREFIX = 'response-cache:version:'
+STATS_PREFIX = 'response-cache:stats:'
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def get_cache_alias():
+    return getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+
+
+def get_cache():
+    return caches[get_cache_alias()]
+
+
+def is_shared(alias=None):
+    """Кеш общий для всех процессов сервера, а не память одного воркера."""
+    backend = settings.CACHES[alias or get_cache_alias()]['BACKEND']
+    return backend not in PROCESS_LOCAL_BACKENDS
+
+
+def is_enabled():
+    """Можно ли кешировать ответы и данные, сбрасываемые версиями групп.
+
+    Версию меняет процесс, обработавший изменение; в кеше в памяти
+    процесса остальные воркеры gunicorn этого не увидят и будут отдавать
+    старые данные. Поэтому по умолчанию кеш работает только с общим
+    бэкендом (Redis, Memcached), а RESPONSE_CACHE_ENABLED включает или
+    выключает его явно, например для сервера из одного процесса.
+    """
+    enabled = getattr(settings, 'RESPONSE_CACHE_ENABLED', None)
+    if enabled is None:
+        return is_shared()
+    return enabled
+
+
+def get_versions(names):
+    """Текущие версии групп; пропавшие из кеша версии создаются заново."""
+    keys = [VERSION_PREFIX + name for name in names]
+    versions = get_cache().get_many(keys)
+    for key in keys:
+        if key not in versions:
+            get_cache().add(key, time.time_ns(), None)
+            versions[key] = get_cache().get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*names):
+    get_cache().set_many(
+        {VERSION_PREFIX + name: time.time_ns() for name in names}, None)
+
+
+def count(event):
+    try:
+        get_cache().incr(STATS_PREFIX + event)
+    except ValueError:
+        if not get_cache().add(STATS_PREFIX + event, 1, None):
+            get_cache().incr(STATS_PREFIX + event)
+
+
+def get_stats():
+    stats = get_cache().get_many(
+        [STATS_PREFIX + 'hit', STATS_PREFIX + 'miss'])
+    hits = stats.get(STATS_PREFIX + 'hit', 0)
+    misses = stats.get(STATS_PREFIX + 'miss', 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses,
+            'hit_ratio': hits / total if total else 0}
+
+
+class SharedResponseCacheMixin:
+    """Кеширует общую для всех пользователей часть ответа.
+
+    cache_groups сопоставляет действию группы версий; смена версии любой
+    группы (см. api.signals) делает устаревшими все ответы с ней. Тело
+    строится как для анонимного пользователя (self.shared_body), а
+    персональные поля накладываются в personalize(). Запросы с
+    параметрами из user_scoped_params кешируются только для анонимов.
+    """
+
+    cache_groups = {}
+    user_scoped_params = ()
+    shared_body = False
+    cache_versions = ()
+
+    def get_response_cache_key(self, request, **kwargs):
+        groups = self.cache_groups.get(self.action)
+        if groups is None or not is_enabled():
+            return None
+        if not request.user.is_anonymous and any(
+                param in request.query_params
+                for param in self.user_scoped_params):
+            return None
+        versions = self.cache_versions = get_versions(
+            [group.format(**kwargs) for group in groups])
+        query = sorted(
+            (key, sorted(request.query_params.getlist(key)))
+            for key in request.query_params
+        )
+        params = (request.get_host(), request.path, query, versions,
+                  request.accepted_renderer.format)
+        return 'response-cache:' + md5(repr(params).encode()).hexdigest()
+
+    def personalize(self, data, user):
+        return data
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_response_cache_key(request, **kwargs)
+        if key is None:
+            return handler(request, *args, **kwargs)
+        data = get_cache().get(key)
+        if data is None:
+            count('miss')
+            self.shared_body = True
+            with primary_if_changed(self.cache_versions):
+                response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            get_cache().set(key, data,
+                            getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+        else:
+            count('hit')
+        if not request.user.is_anonymous:
+            data = self.personalize(data, request.user)
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        patch_vary_headers(response, ('Authorization',))
+        return response
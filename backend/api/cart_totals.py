@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery, Sum
+
+from recipes.models import (Ingredient, IngredientInRecipe, ShoppingCart,
+                            ShoppingCartIngredient)
+
+TOTALS_TABLE = ShoppingCartIngredient._meta.db_table
+CART_TABLE = ShoppingCart._meta.db_table
+ITEMS_TABLE = IngredientInRecipe._meta.db_table
+
+
+def add_recipes(recipe_ids, user_id=None):
+    """Прибавляет ингредиенты рецептов к итогам корзины пользователя или,
+    без user_id, всех корзин, где лежат рецепты.
+    """
+    recipe_filter = ', '.join(['%s'] * len(recipe_ids))
+    user_filter = '' if user_id is None else ' AND cart.user_id = %s'
+    params = list(recipe_ids) + ([] if user_id is None else [user_id])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {TOTALS_TABLE} (user_id, ingredient_id, amount) '
+            f'SELECT cart.user_id, item.ingredient_id, SUM(item.amount) '
+            f'FROM {CART_TABLE} cart JOIN {ITEMS_TABLE} item '
+            f'ON item.recipe_id = cart.recipe_id '
+            f'WHERE cart.recipe_id IN ({recipe_filter}){user_filter} '
+            f'GROUP BY cart.user_id, item.ingredient_id '
+            f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+            f'SET amount = {TOTALS_TABLE}.amount + excluded.amount',
+            params)
+
+
+def remove_recipes(recipe_ids, user_id=None):
+    """Вычитает ингредиенты рецептов из итогов корзины пользователя,
+    обнулившиеся строки удаляются.
+
+    Без user_id рецепт вычитается из всех корзин, где он лежит; так можно
+    вычитать только по одному рецепту.
+    """
+    if user_id is None:
+        users = {'user_id__in': ShoppingCart.objects.filter(
+            recipe_id__in=recipe_ids).values('user_id')}
+    else:
+        users = {'user_id': user_id}
+    items = IngredientInRecipe.objects.filter(recipe_id__in=recipe_ids)
+    ShoppingCartIngredient.objects.filter(
+        ingredient_id__in=items.values('ingredient_id'), **users
+    ).update(amount=F('amount') - Subquery(
+        items.filter(ingredient_id=OuterRef('ingredient_id')).order_by(
+        ).values('ingredient_id').annotate(total=Sum('amount')).values(
+            'total')))
+    ShoppingCartIngredient.objects.filter(amount__lte=0, **users).delete()
+
+
+@contextmanager
+def recipe_change(recipe_id):
+    """Пересчитывает итоги корзин с рецептом при смене его ингредиентов."""
+    remove_recipes([recipe_id])
+    yield
+    add_recipes([recipe_id])
+
+
+def get_expected_totals(user_ids):
+    """Итоги, посчитанные заново по корзинам пользователей."""
+    rows = IngredientInRecipe.objects.filter(
+        recipe__shopping_cart_recipe__user_id__in=user_ids
+    ).values_list(
+        'recipe__shopping_cart_recipe__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by()
+    return {(user_id, ingredient_id): total
+            for user_id, ingredient_id, total in rows}
+
+
+def get_summary(user):
+    return Ingredient.objects.filter(cart_totals__user=user).values(
+        'id', 'name', 'measurement_unit', amount=F('cart_totals__amount')
+    ).order_by('name')
@@ -0,0 +1,16 @@
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+
+from .shopping_list import check_pdf_font
+
+
+@checks.register()
+def shopping_list_font_check(app_configs, **kwargs):
+    try:
+        check_pdf_font()
+    except ImproperlyConfigured as error:
+        return [checks.Warning(
+            str(error), hint='Установите fonts-dejavu-core или укажите путь '
+            'к TTF-шрифту в SHOPPING_LIST_FONT; без него выгрузка в PDF '
+            'отвечает 503', id='api.W001')]
+    return []
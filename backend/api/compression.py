@@ -0,0 +1,90 @@
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+re_accepts_gzip = re.compile(r'\bgzip\b')
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+
+def get_min_size():
+    return getattr(settings, 'RESPONSE_COMPRESSION_MIN_SIZE', 1024)
+
+
+def get_brotli_quality():
+    return getattr(settings, 'RESPONSE_BROTLI_QUALITY', 5)
+
+
+def get_encoding(request):
+    """brotli, если он установлен и его принимает клиент, иначе gzip."""
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if brotli is not None and re_accepts_brotli.search(accepted):
+        return 'br'
+    if re_accepts_gzip.search(accepted):
+        return 'gzip'
+    return None
+
+
+def brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=get_brotli_quality())
+    for item in sequence:
+        compressor.process(item)
+        data = compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """Сжимает JSON и текстовые ответы от RESPONSE_COMPRESSION_MIN_SIZE
+    байт, а также потоковые выгрузки, brotli или gzip.
+
+    Короткие ответы не сжимаются: выигрыш меньше затрат на сжатие.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self.is_compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = get_encoding(request)
+        if encoding is None:
+            return response
+        if response.streaming:
+            response.streaming_content = (
+                brotli_sequence if encoding == 'br' else compress_sequence
+            )(response.streaming_content)
+            del response['Content-Length']
+        else:
+            content = (
+                brotli.compress(response.content,
+                                quality=get_brotli_quality())
+                if encoding == 'br' else compress_string(response.content))
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    @staticmethod
+    def is_compressible(response):
+        if response.has_header('Content-Encoding'):
+            return False
+        if not response.get('Content-Type', '').startswith(
+                COMPRESSIBLE_TYPES):
+            return False
+        return response.streaming or len(response.content) >= get_min_size()
@@ -0,0 +1,56 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import FavoriteRecipe, Recipe, Subscribe, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', FavoriteRecipe, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscribe, 'author'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    change_queryset_counter(model.objects.filter(pk=pk), field, delta)
+
+
+def change_counters(model, field, deltas):
+    """Меняет счётчик у многих строк сразу, deltas — {pk: изменение}."""
+    pks_by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        pks_by_delta[delta].append(pk)
+    for delta, pks in pks_by_delta.items():
+        change_queryset_counter(model.objects.filter(pk__in=pks), field,
+                                delta)
+
+
+def change_queryset_counter(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def get_count_subquery(related_model, related_field):
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+def recount(model, field, related_model, related_field, batch_size=1000):
+    """Пересчитывает счётчик пачками по batch_size строк."""
+    pks = model.objects.order_by('pk').values_list('pk', flat=True)
+    last_pk = 0
+    updated = 0
+    while True:
+        batch = list(pks.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return updated
+        updated += model.objects.filter(pk__in=batch).update(
+            **{field: get_count_subquery(related_model, related_field)})
+        last_pk = batch[-1]
@@ -0,0 +1,37 @@
+from django.db import transaction
+
+
+class PendingIds:
+    """Id, накопленные за транзакцию для одного обработчика."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.ids = set()
+
+    def __call__(self):
+        ids, self.ids = self.ids, set()
+        self.handler(ids)
+
+
+def run_after_commit(handler, ids, using=None):
+    """Вызывает handler(ids) один раз после commit со всеми id, собранными
+    за транзакцию, без повторов.
+
+    Вне транзакции handler вызывается сразу. Если накопленный вызов
+    отменён откатом (в том числе точки сохранения), следующие id
+    собираются заново.
+    """
+    ids = set(ids)
+    if not ids:
+        return
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        handler(ids)
+        return
+    pending_calls = connection.__dict__.setdefault('pending_ids', {})
+    pending = pending_calls.get(handler)
+    if pending is None or not any(
+            callback is pending for _, callback in connection.run_on_commit):
+        pending = pending_calls[handler] = PendingIds(handler)
+        transaction.on_commit(pending, using)
+    pending.ids.update(ids)
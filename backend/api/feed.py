@@ -0,0 +1,216 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from heapq import merge
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+
+from .counters import change_counters
+from .pagination import keyset_filter
+from recipes.models import FeedItem, Recipe, Subscribe, User
+
+logger = logging.getLogger(__name__)
+
+FEED_BATCH_SIZE = 1000
+FEED_BACKFILL_RECIPES = 100
+FEED_TABLE = FeedItem._meta.db_table
+RECIPE_TABLE = Recipe._meta.db_table
+SUBSCRIBE_TABLE = Subscribe._meta.db_table
+
+
+def get_fanout_limit():
+    return getattr(settings, 'FEED_FANOUT_LIMIT', 1000)
+
+
+def get_batch_size():
+    """FEED_BATCH_SIZE, но не больше, чем принимает база за один запрос."""
+    fields = [FeedItem._meta.get_field(name)
+              for name in ('user', 'recipe', 'pub_date')]
+    return min(FEED_BATCH_SIZE,
+               connection.ops.bulk_batch_size(fields, []))
+
+
+def is_fanout_author(author_id):
+    """Рецепты автора раскладываются по лентам подписчиков при записи.
+
+    Для авторов с большим числом подписчиков лента собирается при чтении.
+    """
+    return User.objects.filter(
+        pk=author_id, followers_count__lte=get_fanout_limit()).exists()
+
+
+def fan_out_recipe(recipe):
+    if not is_fanout_author(recipe.author_id):
+        return
+    FeedItem.objects.bulk_create(
+        (FeedItem(user_id=user_id, recipe=recipe, pub_date=recipe.pub_date)
+         for user_id in Subscribe.objects.filter(
+            author_id=recipe.author_id).values_list('user_id', flat=True)),
+        batch_size=get_batch_size(),
+        ignore_conflicts=True,
+    )
+
+
+def update_recipe_date(recipe):
+    FeedItem.objects.filter(recipe=recipe).update(pub_date=recipe.pub_date)
+
+
+def add_subscriptions_to_feed(pairs):
+    """Раскладывает рецепты авторов по лентам для пар (подписчик, автор)."""
+    users_by_author = defaultdict(list)
+    for user_id, author_id in pairs:
+        users_by_author[author_id].append(user_id)
+    recipes = Recipe.objects.filter(
+        author_id__in=users_by_author,
+        author__followers_count__lte=get_fanout_limit(),
+    ).values_list('author_id', 'id', 'pub_date').iterator()
+    FeedItem.objects.bulk_create(
+        (FeedItem(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+         for author_id, recipe_id, pub_date in recipes
+         for user_id in users_by_author[author_id]),
+        batch_size=get_batch_size(),
+        ignore_conflicts=True,
+    )
+
+
+def change_followers_count(deltas):
+    """Меняет followers_count авторов ({id автора: изменение}).
+
+    Пока у автора больше FEED_FANOUT_LIMIT подписчиков, его рецепты и
+    новые подписки на него в ленты не раскладываются, и feed_complete
+    сбрасывается. Когда автор опускается до порога, ленты дозаполняются
+    в фоне, а до конца дозаполнения его рецепты по-прежнему
+    подмешиваются при чтении.
+    """
+    change_counters(User, 'followers_count', deltas)
+    limit = get_fanout_limit()
+    increased = [pk for pk, delta in deltas.items() if delta > 0]
+    if increased:
+        User.objects.filter(pk__in=increased, followers_count__gt=limit,
+                            feed_complete=True).update(feed_complete=False)
+    decreased = [pk for pk, delta in deltas.items() if delta < 0]
+    if decreased:
+        schedule_backfill(list(User.objects.filter(
+            pk__in=decreased, followers_count__lte=limit,
+            feed_complete=False).values_list('pk', flat=True)))
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='feed')
+
+
+def schedule_backfill(author_ids):
+    if author_ids:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_backfill, author_ids))
+
+
+def run_backfill(author_ids):
+    close_old_connections()
+    try:
+        backfill_feeds(author_ids)
+    except Exception:
+        logger.exception('Не удалось дозаполнить ленты авторов %s',
+                         author_ids)
+    finally:
+        close_old_connections()
+
+
+def backfill_feeds(author_ids):
+    """Раскладывает все рецепты авторов по лентам их подписчиков пачками
+    по FEED_BACKFILL_RECIPES рецептов; уже разложенные пропускаются.
+    Авторы, у которых подписчиков снова больше порога, пропускаются.
+    """
+    limit = get_fanout_limit()
+    for author_id in author_ids:
+        recipe_ids = Recipe.objects.filter(author_id=author_id).order_by(
+            'pk').values_list('pk', flat=True)
+        last_pk = 0
+        while User.objects.filter(pk=author_id,
+                                  followers_count__lte=limit).exists():
+            batch = list(recipe_ids.filter(
+                pk__gt=last_pk)[:FEED_BACKFILL_RECIPES])
+            if not batch:
+                User.objects.filter(
+                    pk=author_id, followers_count__lte=limit
+                ).update(feed_complete=True)
+                break
+            fan_out_recipes(batch)
+            last_pk = batch[-1]
+
+
+def refresh_feed_state():
+    """Приводит feed_complete в соответствие с FEED_FANOUT_LIMIT после
+    пересчёта счётчиков или смены порога и сразу дозаполняет ленты.
+    Возвращает число дозаполненных авторов.
+    """
+    limit = get_fanout_limit()
+    User.objects.filter(followers_count__gt=limit,
+                        feed_complete=True).update(feed_complete=False)
+    author_ids = list(User.objects.filter(
+        followers_count__lte=limit, feed_complete=False
+    ).values_list('pk', flat=True))
+    backfill_feeds(author_ids)
+    return len(author_ids)
+
+
+def fan_out_recipes(recipe_ids):
+    """Раскладывает рецепты по лентам подписчиков их авторов одним
+    запросом.
+    """
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {FEED_TABLE} (user_id, recipe_id, pub_date) '
+            f'SELECT subscribe.user_id, recipe.id, recipe.pub_date '
+            f'FROM {RECIPE_TABLE} recipe '
+            f'JOIN {SUBSCRIBE_TABLE} subscribe '
+            f'ON subscribe.author_id = recipe.author_id '
+            f'WHERE recipe.id IN ({placeholders}) '
+            f'ON CONFLICT (user_id, recipe_id) DO NOTHING',
+            list(recipe_ids))
+
+
+def remove_authors_from_feed(user_id, author_ids):
+    FeedItem.objects.filter(
+        user_id=user_id, recipe__author_id__in=author_ids).delete()
+
+
+def get_pull_authors(user):
+    """Авторы из подписок пользователя, чьи рецепты не раскладываются
+    или разложены по лентам не полностью.
+    """
+    return User.objects.filter(
+        Q(followers_count__gt=get_fanout_limit()) | Q(feed_complete=False),
+        subscribe__user=user,
+    ).values_list('pk', flat=True)
+
+
+def get_feed_page(user, queryset, position, page_size):
+    """Страница ленты и позиция следующей страницы (или None)."""
+    pushed = keyset_filter(
+        FeedItem.objects.filter(user=user), position,
+        pk_field='recipe_id'
+    ).order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id')[:page_size + 1]
+    streams = [list(pushed)]
+    pull_authors = list(get_pull_authors(user))
+    if pull_authors:
+        streams.append(list(keyset_filter(
+            Recipe.objects.filter(author_id__in=pull_authors), position
+        ).order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id')[:page_size + 1]))
+    positions = []
+    for item in merge(*streams, reverse=True):
+        if not positions or positions[-1] != item:
+            positions.append(item)
+        if len(positions) > page_size:
+            break
+    page = positions[:page_size]
+    recipes = queryset.in_bulk([pk for _, pk in page])
+    next_position = page[-1] if len(positions) > page_size else None
+    return [recipes[pk] for _, pk in page if pk in recipes], next_position
@@ -0,0 +1,34 @@
+import base64
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.core.files import File
+from drf_base64.fields import Base64ImageField
+
+DECODE_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class StreamingBase64ImageField(Base64ImageField):
+    """Base64ImageField, декодирующий данные частями во временный файл.
+
+    Крупные изображения не держатся в памяти целиком в виде bytes:
+    после SPOOL_MAX_SIZE данные сбрасываются на диск.
+    """
+
+    def _decode(self, data):
+        if not (isinstance(data, str) and data.startswith('data:')):
+            return super()._decode(data)
+        marker = data.find(';base64,')
+        if marker == -1:
+            return super()._decode(data)
+        extension = data[:marker].split('/')[-1]
+        if extension[:3] == 'svg':
+            extension = 'svg'
+        file = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        start = marker + len(';base64,')
+        for position in range(start, len(data), DECODE_CHUNK_SIZE):
+            file.write(base64.b64decode(
+                data[position:position + DECODE_CHUNK_SIZE]))
+        file.seek(0)
+        return File(file, name=f'{uuid.uuid4()}.{extension}')
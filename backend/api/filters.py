@@ -1,11 +1,20 @@
 import django_filters.rest_framework as filters
-from rest_framework.filters import SearchFilter
+from django.db.models import Exists, OuterRef
+from rest_framework.filters import OrderingFilter
 
+from .search import search_recipes
+from .tags import get_tag_ids
 from recipes.models import Recipe
 
 
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
+
+
 class RecipeFilter(filters.FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.MultipleChoiceFilter(choices=get_tag_choices,
+                                        method='get_recipes_with_tags')
+    search = filters.CharFilter(method='get_recipes_by_text')
     is_favorited = filters.filters.BooleanFilter(
         method='get_is_recipe_in_favorite')
     is_in_shopping_cart = filters.filters.BooleanFilter(
@@ -15,6 +24,21 @@ class RecipeFilter(filters.FilterSet):
         model = Recipe
         fields = ['is_favorited', 'is_in_shopping_cart', 'author', 'tags']
 
+    def get_recipes_with_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        tag_ids = get_tag_ids()
+        return queryset.annotate(has_tags=Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'),
+                tag_id__in=[tag_ids[slug] for slug in value]))
+        ).filter(has_tags=True)
+
+    def get_recipes_by_text(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
+
     def get_is_recipe_in_favorite(self, queryset, name, value):
         if value:
             user = self.request.user
@@ -29,5 +53,11 @@ class RecipeFilter(filters.FilterSet):
         return queryset
 
 
-class IngredientFilter(SearchFilter):
-    search_param = 'name'
+class RecipeOrderingFilter(OrderingFilter):
+    """Сортировка ?ordering= с устойчивым порядком при равных значениях."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering:
+            return [*ordering, '-pub_date', '-id']
+        return ordering
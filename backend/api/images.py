@@ -0,0 +1,132 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image
+
+from . import cache
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SIZES = {'card': 480, 'detail': 1024, 'retina': 2048}
+SAVE_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG',
+                '.gif': 'GIF', '.webp': 'WEBP'}
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=getattr(settings, 'IMAGE_WORKERS', 2),
+        thread_name_prefix='recipe-images')
+
+
+def get_variant_name(name, label, webp=False):
+    root, extension = os.path.splitext(name)
+    return f'{root}_{label}{".webp" if webp else extension}'
+
+
+def save_image(image, name, image_format):
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, image_format)
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def run_in_worker(function, *args):
+    """Запуск в фоновом потоке: его соединения с базой закрываются здесь,
+    а не в самой функции, которую вызывают и в потоке запроса."""
+    close_old_connections()
+    try:
+        function(*args)
+    finally:
+        close_old_connections()
+
+
+def make_variants(recipe_id, name):
+    """Уменьшенные копии изображения рецепта в исходном формате и WebP."""
+    try:
+        with default_storage.open(name) as file:
+            original = Image.open(file)
+            original.load()
+        image_format = SAVE_FORMATS.get(
+            os.path.splitext(name)[1].lower(), 'PNG')
+        for label, size in IMAGE_SIZES.items():
+            image = original.copy()
+            image.thumbnail((size, size))
+            save_image(image, get_variant_name(name, label), image_format)
+            save_image(image, get_variant_name(name, label, webp=True),
+                       'WEBP')
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+        return
+    if not Recipe.objects.filter(pk=recipe_id, image=name).update(
+            image_variants_ready=True):
+        # Изображение заменили или рецепт удалили, пока шла обработка.
+        delete_images(name)
+        return
+    cache.invalidate('recipe-list', f'recipe:{recipe_id}')
+
+
+def schedule_variants(recipe):
+    recipe_id, name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: get_executor().submit(
+            run_in_worker, make_variants, recipe_id, name))
+
+
+def delete_images(name):
+    """Удаляет изображение и все его варианты, если на файл больше не
+    ссылается ни один рецепт.
+    """
+    try:
+        if Recipe.objects.filter(image=name).exists():
+            return
+        names = [name, *(
+            get_variant_name(name, label, webp)
+            for label in IMAGE_SIZES for webp in (False, True))]
+        for variant in names:
+            if default_storage.exists(variant):
+                default_storage.delete(variant)
+    except Exception:
+        logger.exception('Не удалось удалить изображение %s', name)
+
+
+def schedule_delete(name):
+    """Удаляет файлы после коммита: при откате они ещё нужны."""
+    if name:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_in_worker, delete_images, name))
+
+
+def get_image_urls(recipe, request=None):
+    """Ссылки на варианты изображения для srcset.
+
+    Пока фоновая обработка не завершена, все размеры ведут на оригинал.
+    """
+    if not recipe.image:
+        return None
+
+    def build_url(name):
+        url = default_storage.url(name)
+        return request.build_absolute_uri(url) if request else url
+
+    name = recipe.image.name
+    urls = {'original': build_url(name)}
+    for label in IMAGE_SIZES:
+        if recipe.image_variants_ready:
+            urls[label] = build_url(get_variant_name(name, label))
+            urls[f'{label}_webp'] = build_url(
+                get_variant_name(name, label, webp=True))
+        else:
+            urls[label] = urls[f'{label}_webp'] = urls['original']
+    return urls
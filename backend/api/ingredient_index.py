@@ -0,0 +1,71 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from recipes.models import Ingredient
+
+
+class IngredientIndex:
+    """Префиксный индекс названий ингредиентов в памяти процесса.
+
+    Справочник небольшой и почти не меняется, поэтому автодополнение
+    обслуживается без запросов к базе. Индекс сбрасывается сигналами
+    модели Ingredient, а изменения из других процессов подхватываются
+    по истечении INGREDIENT_INDEX_TTL секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._entries = None
+        self._built_at = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+            self._entries = None
+
+    def _get(self):
+        ttl = getattr(settings, 'INGREDIENT_INDEX_TTL', 300)
+        with self._lock:
+            expired = time.monotonic() - self._built_at > ttl
+            if self._entries is None or expired:
+                rows = sorted(
+                    (name.lower(), name, measurement_unit, pk)
+                    for pk, name, measurement_unit
+                    in Ingredient.objects.values_list(
+                        'id', 'name', 'measurement_unit')
+                )
+                self._keys = [row[0] for row in rows]
+                self._entries = [
+                    {'name': name, 'measurement_unit': unit, 'id': pk}
+                    for _, name, unit, pk in rows
+                ]
+                self._built_at = time.monotonic()
+            return self._keys, self._entries
+
+    def search(self, query='', limit=None):
+        """Сначала совпадения по началу названия, затем по подстроке."""
+        keys, entries = self._get()
+        query = query.strip().lower()
+        if not query:
+            return entries[:limit]
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        result = entries[start:end]
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+        for position, key in enumerate(keys):
+            if start <= position < end or query not in key:
+                continue
+            result.append(entries[position])
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -1,26 +1,15 @@
-import csv
+import os
 
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 
 from foodgram.settings import CSV_FILES_DIR
-from recipes.models import Ingredient
 
 
 class Command(BaseCommand):
     help = 'Добавление ингредиентов в базу данных'
 
     def handle(self, *args, **kwargs):
-        with open(
-                f'{CSV_FILES_DIR}/ingredients.csv', encoding='utf-8'
-        ) as file:
-            reader = csv.reader(file)
-            next(reader)
-            ingredients = [
-                Ingredient(
-                    name=row[0],
-                    measurement_unit=row[1],
-                )
-                for row in reader
-            ]
-            Ingredient.objects.bulk_create(ingredients)
-        print('успех')
+        call_command('import_data',
+                     os.path.join(CSV_FILES_DIR, 'ingredients.csv'),
+                     model='ingredients', stdout=self.stdout)
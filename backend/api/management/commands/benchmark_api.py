@@ -0,0 +1,244 @@
+import base64
+import json
+import platform
+import time
+import tracemalloc
+from io import BytesIO
+from itertools import product
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.cache import get_cache
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag, User
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def get_image_payload():
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), (40, 120, 200)).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class Command(BaseCommand):
+    help = ('Замер времени ответа, числа SQL-запросов и выделений памяти '
+            'для основных адресов API; результат сохраняется в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--user', help='Email пользователя для запросов; '
+                                           'по умолчанию самый активный')
+        parser.add_argument('--only', help='Только сценарии, в названии '
+                                           'которых есть эта строка')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кеш ответов перед каждым запросом')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--baseline',
+                            help='JSON с предыдущего запуска для сравнения')
+        parser.add_argument('--threshold', type=float, default=20,
+                            help='Допустимый рост p50 в процентах')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client = Client(HTTP_HOST='127.0.0.1',
+                             HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.options = options
+        self.created = []
+        results = {}
+        try:
+            for name, method, url, data in self.get_scenarios(user):
+                if options['only'] and options['only'] not in name:
+                    continue
+                results[name] = self.run_scenario(method, url, data)
+                self.stdout.write(
+                    f'{name:<60} p50 {results[name]["p50_ms"]:8.2f} мс  '
+                    f'{results[name]["rps"]:8.1f} запросов/с  '
+                    f'SQL {results[name]["queries"]:3}  '
+                    f'{results[name]["allocated_kb"]:8.1f} КБ')
+        finally:
+            Recipe.objects.filter(pk__in=self.created).delete()
+        report = {
+            'meta': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'cold': options['cold'],
+                'recipes': Recipe.objects.count(),
+                'users': User.objects.count(),
+            },
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['threshold'])
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+            if user is None:
+                raise CommandError(f'Пользователь {email} не найден')
+            return user
+        user = User.objects.annotate(
+            activity=Count('shopping_cart', distinct=True)
+            + Count('subscriber', distinct=True)
+            + Count('recipes', distinct=True)
+        ).order_by('-activity').first()
+        if user is None:
+            raise CommandError('Нет данных, запустите generate_data')
+        return user
+
+    def get_scenarios(self, user):
+        tags = list(Tag.objects.annotate(
+            total=Count('recipes')).order_by('-total').values_list(
+            'slug', flat=True)[:2])
+        author = Recipe.objects.values('author').annotate(
+            total=Count('pk')).order_by('-total').values_list(
+            'author', flat=True).first()
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        own = Recipe.objects.filter(author=user).first()
+        ingredient = Ingredient.objects.first()
+        if recipe is None or ingredient is None:
+            raise CommandError('Нет данных, запустите generate_data')
+        page = 'page=1&limit=6'
+        filters = {
+            'tags': '&'.join(f'tags={slug}' for slug in tags),
+            'author': f'author={author}',
+            'is_favorited': 'is_favorited=1',
+            'is_in_shopping_cart': 'is_in_shopping_cart=1',
+        }
+        for enabled in product((False, True), repeat=len(filters)):
+            params = [value for value, on in zip(filters.values(), enabled)
+                      if on]
+            names = [key for key, on in zip(filters, enabled) if on]
+            yield (f'recipes.list[{",".join(names)}]', 'get',
+                   '/api/recipes/?' + '&'.join([page, *params]), None)
+        yield ('recipes.list[ordering=-favorites_count]', 'get',
+               f'/api/recipes/?{page}&ordering=-favorites_count', None)
+        yield ('recipes.list[search]', 'get',
+               f'/api/recipes/?{page}&search={recipe.name.split()[-2]}',
+               None)
+        yield ('recipes.list[search=name]', 'get',
+               f'/api/recipes/?{page}&search={recipe.name}', None)
+        yield 'recipes.detail', 'get', f'/api/recipes/{recipe.pk}/', None
+        yield 'recipes.feed', 'get', '/api/recipes/feed/', None
+        yield ('users.subscriptions', 'get',
+               '/api/users/subscriptions/?limit=6&recipes_limit=3', None)
+        yield ('recipes.download_shopping_cart', 'get',
+               '/api/recipes/download_shopping_cart/', None)
+        for length in (1, 3):
+            yield (f'ingredients.search[{length}]', 'get',
+                   f'/api/ingredients/?name={ingredient.name[:length]}',
+                   None)
+        common = list(IngredientInRecipe.objects.values(
+            'ingredient').annotate(total=Count('pk')).order_by(
+            '-total').values_list('ingredient', flat=True)[:20])
+        for size, coverage in product((1, 5, 20), (100, 50)):
+            if size == 1 and coverage < 100:
+                continue
+            ids = ','.join(map(str, common[:size]))
+            yield (f'recipes.by_ingredients[{size},{coverage}%]', 'get',
+                   f'/api/recipes/by_ingredients/?ingredients={ids}'
+                   f'&min_coverage={coverage}&{page}', None)
+        yield 'tags.list', 'get', '/api/tags/', None
+        payload = {
+            'name': 'Замер',
+            'text': 'Рецепт для замера производительности',
+            'cooking_time': 10,
+            'image': get_image_payload(),
+            'tags': list(Tag.objects.values_list('pk', flat=True)[:2]),
+            'ingredients': [
+                {'id': pk, 'amount': 10}
+                for pk in Ingredient.objects.values_list('pk', flat=True)[:8]
+            ],
+        }
+        yield 'recipes.create', 'post', '/api/recipes/', payload
+        if own is not None:
+            yield ('recipes.update', 'patch', f'/api/recipes/{own.pk}/',
+                   dict(payload, name=own.name))
+
+    def request(self, method, url, data):
+        if self.options['cold']:
+            get_cache().clear()
+        if data is None:
+            response = getattr(self.client, method)(url)
+        else:
+            response = getattr(self.client, method)(
+                url, json.dumps(data), content_type='application/json')
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{method.upper()} {url}: {response.status_code}')
+        if method == 'post':
+            self.created.append(response.json()['id'])
+        if response.streaming:
+            return response, sum(map(len, response.streaming_content))
+        return response, len(response.content)
+
+    def run_scenario(self, method, url, data):
+        for _ in range(self.options['warmup']):
+            self.request(method, url, data)
+        durations = []
+        for _ in range(self.options['iterations']):
+            started = time.perf_counter()
+            self.request(method, url, data)
+            durations.append(time.perf_counter() - started)
+        # Запросы и память считаются отдельным проходом, чтобы
+        # tracemalloc и CaptureQueriesContext не искажали время.
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            before = tracemalloc.take_snapshot()
+            response, size = self.request(method, url, data)
+            after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        allocated = sum(
+            stat.size_diff for stat in after.compare_to(before, 'filename')
+            if stat.size_diff > 0)
+        return {
+            'method': method.upper(),
+            'url': url,
+            'status': response.status_code,
+            'p50_ms': percentile(durations, 0.5) * 1000,
+            'p90_ms': percentile(durations, 0.9) * 1000,
+            'p99_ms': percentile(durations, 0.99) * 1000,
+            'mean_ms': sum(durations) / len(durations) * 1000,
+            'rps': len(durations) / sum(durations),
+            'queries': len(queries),
+            'bytes': size,
+            'allocated_kb': allocated / 1024,
+            'peak_kb': peak / 1024,
+        }
+
+    def compare(self, results, path, threshold):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['scenarios']
+        regressions = []
+        for name, old in baseline.items():
+            new = results.get(name)
+            if new is None:
+                continue
+            if new['queries'] > old['queries']:
+                regressions.append(
+                    f'{name}: запросов {old["queries"]} -> {new["queries"]}')
+            if new['p50_ms'] > old['p50_ms'] * (1 + threshold / 100):
+                regressions.append(
+                    f'{name}: p50 {old["p50_ms"]:.2f} -> '
+                    f'{new["p50_ms"]:.2f} мс')
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий не найдено'))
@@ -0,0 +1,69 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.cache import get_cache
+from api.feed import get_fanout_limit
+from api.management.commands.benchmark_api import percentile
+from recipes.models import User
+
+
+class Command(BaseCommand):
+    help = ('Замер ленты подписок для случайных пользователей: p50/p99 '
+            'первой и следующей страницы отдельно для лент только из '
+            'FeedItem и лент с авторами, которые собираются при чтении')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500,
+                            help='Сколько пользователей опросить')
+        parser.add_argument('--pages', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        limit = get_fanout_limit()
+        user_ids = list(User.objects.filter(
+            subscriber__isnull=False).distinct().values_list(
+            'pk', flat=True))
+        if not user_ids:
+            raise CommandError('Нет подписок, запустите generate_data')
+        random.Random(options['seed']).shuffle(user_ids)
+        pull_users = set(User.objects.filter(
+            Q(subscriber__author__followers_count__gt=limit)
+            | Q(subscriber__author__feed_complete=False),
+            pk__in=user_ids[:options['users']],
+        ).values_list('pk', flat=True))
+        self.stdout.write(
+            f'Пользователей: {User.objects.count()}, с подписками: '
+            f'{len(user_ids)}, FEED_FANOUT_LIMIT={limit}')
+        client = APIClient(HTTP_HOST='127.0.0.1')
+        durations = {}
+        queries = {}
+        for user in User.objects.filter(pk__in=user_ids[:options['users']]):
+            client.force_authenticate(user)
+            kind = 'с чтением авторов' if user.pk in pull_users else 'FeedItem'
+            url = '/api/recipes/feed/'
+            for page in range(1, options['pages'] + 1):
+                get_cache().clear()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    elapsed = time.perf_counter() - started
+                if response.status_code != 200:
+                    raise CommandError(f'{url}: {response.status_code}')
+                key = (kind, page)
+                durations.setdefault(key, []).append(elapsed)
+                queries.setdefault(key, []).append(len(captured))
+                url = response.data['next']
+                if not url:
+                    break
+        for (kind, page), values in sorted(durations.items()):
+            self.stdout.write(
+                f'{kind:<18} стр. {page}: {len(values):5} лент  p50 '
+                f'{percentile(values, 0.5) * 1000:7.1f} мс  p99 '
+                f'{percentile(values, 0.99) * 1000:7.1f} мс  SQL '
+                f'{max(queries[kind, page])}')
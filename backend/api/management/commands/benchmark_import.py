@@ -0,0 +1,117 @@
+import csv
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api import cache
+from recipes.models import Ingredient, Recipe, User
+
+PREFIX = 'benchmark-import'
+UNITS = ('г', 'кг', 'мл', 'л', 'шт', 'ст. л.', 'ч. л.', 'по вкусу')
+
+
+class Command(BaseCommand):
+    help = ('Замер import_data на синтетическом файле: ингредиенты '
+            '(по умолчанию 1 000 000 строк) и рецепты; каждый импорт '
+            'запускается дважды, второй раз — по уже загруженным данным')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000,
+                            help='Строк с ингредиентами')
+        parser.add_argument('--recipes', type=int, default=10_000)
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            default='csv',
+                            help='Формат файла с ингредиентами')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--copy', action='store_true',
+                            help='Ингредиенты через COPY (PostgreSQL)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Не удалять загруженные данные')
+
+    def handle(self, *args, **options):
+        if (Ingredient.objects.filter(name__startswith=PREFIX).exists()
+                or Recipe.objects.filter(name__startswith=PREFIX).exists()):
+            raise CommandError(
+                f'В базе уже есть данные с префиксом {PREFIX}')
+        author = User.objects.order_by('pk').first()
+        if options['recipes'] and author is None:
+            raise CommandError('Для рецептов нужен хотя бы один пользователь')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f'ingredients.{options["format"]}')
+            self.write_ingredients(path, options['rows'])
+            self.run_import(
+                'ingredients', path, options['rows'],
+                batch_size=options['batch_size'], copy=options['copy'])
+            if options['recipes']:
+                path = os.path.join(directory, 'recipes.jsonl')
+                self.write_recipes(path, options['recipes'], author.email,
+                                   options['rows'])
+                self.run_import('recipes', path, options['recipes'],
+                                model='recipes',
+                                batch_size=options['batch_size'])
+        if not options['keep']:
+            self.cleanup()
+
+    def run_import(self, name, path, rows, **options):
+        self.stdout.write(
+            f'{name}: {rows} строк, файл {os.path.getsize(path) >> 20} МБ')
+        for attempt in ('первый', 'повторный'):
+            started = time.perf_counter()
+            call_command('import_data', path, stdout=StringIO(), **options)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'  {attempt:<9} импорт {elapsed:7.1f} с  '
+                f'{rows / elapsed:9.0f} строк/с')
+
+    @staticmethod
+    def write_ingredients(path, rows):
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            if path.endswith('.csv'):
+                writer = csv.writer(file)
+                for number in range(rows):
+                    writer.writerow([f'{PREFIX} {number}',
+                                     UNITS[number % len(UNITS)]])
+                return
+            for number in range(rows):
+                file.write(json.dumps(
+                    {'name': f'{PREFIX} {number}',
+                     'measurement_unit': UNITS[number % len(UNITS)]},
+                    ensure_ascii=False) + '\n')
+
+    @staticmethod
+    def write_recipes(path, count, author, ingredients):
+        with open(path, 'w', encoding='utf-8') as file:
+            for number in range(count):
+                file.write(json.dumps({
+                    'author': author,
+                    'name': f'{PREFIX} {number}',
+                    'text': 'Синтетический рецепт для замера импорта',
+                    'cooking_time': number % 120 + 1,
+                    'tags': [],
+                    'ingredients': [
+                        {'name': f'{PREFIX} {index}',
+                         'measurement_unit': UNITS[index % len(UNITS)],
+                         'amount': number % 500 + 1}
+                        for index in (
+                            (number * 7 + shift) % ingredients
+                            for shift in range(5))
+                    ],
+                }, ensure_ascii=False) + '\n')
+
+    def cleanup(self):
+        Recipe.objects.filter(name__startswith=PREFIX).delete()
+        # Ингредиенты без рецептов удаляются одним запросом: delete()
+        # загрузил бы в память миллион объектов.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Ingredient._meta.db_table} '
+                f'WHERE name LIKE %s',
+                [f'{PREFIX} %'])
+        cache.invalidate('ingredients', 'recipes')
+        self.stdout.write('Загруженные данные удалены')
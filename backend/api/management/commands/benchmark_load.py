@@ -0,0 +1,101 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+import requests
+from django.core.management.base import BaseCommand
+
+from .benchmark_api import percentile
+
+DEFAULT_PATHS = (
+    '/api/recipes/?page=1&limit=6',
+    '/api/tags/',
+    '/api/ingredients/?name=%D1%81',
+    '/api/ingredients/?name=%D1%81%D0%BE%D0%BB',
+)
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный замер запущенного сервера: пропускная способность '
+            'и задержки при разном числе одновременных клиентов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Адрес для запросов, можно указать '
+                                 'несколько раз')
+        parser.add_argument('--concurrency', type=int, nargs='+',
+                            default=[50, 200, 500])
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Число запросов на каждом уровне')
+        parser.add_argument('--token', help='Токен для заголовка '
+                                            'Authorization')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.paths = options['paths'] or DEFAULT_PATHS
+        self.headers = ({'Authorization': f'Token {options["token"]}'}
+                        if options['token'] else {})
+        results = {}
+        for clients in options['concurrency']:
+            result = self.run_level(clients)
+            results[str(clients)] = result
+            self.stdout.write(
+                f'{clients:>4} клиентов: {result["rps"]:8.1f} запросов/с  '
+                f'p50 {result["p50_ms"]:8.1f} мс  '
+                f'p99 {result["p99_ms"]:8.1f} мс  '
+                f'ошибок {result["errors"]}')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({'url': options['url'], 'paths': list(self.paths),
+                           'levels': results}, file, indent=2)
+
+    def run_level(self, clients):
+        total = self.options['requests']
+        numbers = count()
+        lock = threading.Lock()
+        durations = []
+        errors = []
+        local = threading.local()
+
+        def client():
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+                local.session.headers.update(self.headers)
+            while True:
+                with lock:
+                    number = next(numbers)
+                if number >= total:
+                    return
+                url = self.options['url'] + self.paths[
+                    number % len(self.paths)]
+                started = time.perf_counter()
+                try:
+                    response = local.session.get(
+                        url, timeout=self.options['timeout'])
+                    failed = response.status_code >= 400
+                except requests.RequestException:
+                    failed = True
+                duration = time.perf_counter() - started
+                with lock:
+                    durations.append(duration)
+                    if failed:
+                        errors.append(number)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            for _ in range(clients):
+                executor.submit(client)
+        elapsed = time.perf_counter() - started
+        return {
+            'requests': len(durations),
+            'errors': len(errors),
+            'rps': len(durations) / elapsed,
+            'p50_ms': percentile(durations, 0.5) * 1000,
+            'p90_ms': percentile(durations, 0.9) * 1000,
+            'p99_ms': percentile(durations, 0.99) * 1000,
+        }
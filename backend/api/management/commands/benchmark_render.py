@@ -0,0 +1,61 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+
+from api.compression import brotli, get_brotli_quality
+from api.renderers import FastJSONRenderer, orjson
+
+
+class Command(BaseCommand):
+    help = ('Замер рендеринга JSON и размера ответа после сжатия для '
+            'страницы списка рецептов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100,
+                            help='Рецептов на странице')
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST='127.0.0.1')
+        response = client.get(
+            f'/api/recipes/?page=1&limit={options["recipes"]}')
+        data = response.data
+        self.stdout.write(
+            f'Рецептов на странице: {len(data["results"])}; orjson '
+            f'{"установлен" if orjson else "не установлен"}, brotli '
+            f'{"установлен" if brotli else "не установлен"}')
+        renderers = [('json', JSONRenderer())]
+        if orjson is not None:
+            renderers.append(('orjson', FastJSONRenderer()))
+        for name, renderer in renderers:
+            content = renderer.render(data)
+            durations = []
+            for _ in range(options['iterations']):
+                started = time.perf_counter()
+                renderer.render(data)
+                durations.append(time.perf_counter() - started)
+            self.stdout.write(
+                f'{name:<8} рендер {statistics.median(durations) * 1000:7.2f}'
+                f' мс  {len(content):8} байт')
+        for name, compress in self.get_compressors():
+            durations = []
+            for _ in range(options['iterations']):
+                started = time.perf_counter()
+                compressed = compress(content)
+                durations.append(time.perf_counter() - started)
+            self.stdout.write(
+                f'{name:<8} сжатие {statistics.median(durations) * 1000:7.2f}'
+                f' мс  {len(compressed):8} байт '
+                f'({len(compressed) / len(content):.0%})')
+
+    @staticmethod
+    def get_compressors():
+        compressors = [('gzip', compress_string)]
+        if brotli is not None:
+            compressors.append(('br', lambda content: brotli.compress(
+                content, quality=get_brotli_quality())))
+        return compressors
@@ -0,0 +1,76 @@
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from api import user_recipes
+from api.cache import get_cache
+from api.shopping_list import STREAMS
+from recipes.models import Recipe, ShoppingCart, User
+
+
+def get_chunks(response):
+    # PDF собирается целиком и приходит обычным ответом.
+    if response.streaming:
+        return response.streaming_content
+    return [response.content]
+
+
+class Command(BaseCommand):
+    help = ('Замер выгрузки списка покупок: время до первого байта, полное '
+            'время и пиковая память для корзины из --recipes рецептов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--iterations', type=int, default=5)
+        parser.add_argument('--email', help='Пользователь для замера')
+
+    def handle(self, *args, **options):
+        user = (User.objects.filter(email=options['email']).first()
+                if options['email'] else User.objects.first())
+        if user is None:
+            raise CommandError('Нет пользователя, запустите generate_data')
+        recipe_ids = list(Recipe.objects.exclude(
+            shopping_cart_recipe__user=user).values_list(
+            'pk', flat=True)[:max(options['recipes'] - ShoppingCart.objects
+                                  .filter(user=user).count(), 0)])
+        added = user_recipes.add(ShoppingCart, user.pk, recipe_ids)
+        try:
+            self.measure(user, options['iterations'])
+        finally:
+            user_recipes.remove(ShoppingCart, user.pk, added)
+
+    def measure(self, user, iterations):
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}',
+                        HTTP_HOST='127.0.0.1')
+        self.stdout.write(
+            f'Рецептов в корзине: '
+            f'{ShoppingCart.objects.filter(user=user).count()}, '
+            f'ингредиентов: {user.cart_ingredients.count()}')
+        for extension in (*STREAMS, 'pdf'):
+            url = f'/api/recipes/download_shopping_cart/?format={extension}'
+            first_byte, durations = [], []
+            for _ in range(iterations):
+                get_cache().clear()
+                started = time.perf_counter()
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError(f'{url}: {response.status_code}')
+                chunks = iter(get_chunks(response))
+                size = len(next(chunks, b''))
+                first_byte.append(time.perf_counter() - started)
+                size += sum(map(len, chunks))
+                durations.append(time.perf_counter() - started)
+            tracemalloc.start()
+            size = sum(map(len, get_chunks(client.get(url))))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.stdout.write(
+                f'{extension:<5} первый байт '
+                f'{statistics.median(first_byte) * 1000:8.1f} мс  всего '
+                f'{statistics.median(durations) * 1000:8.1f} мс  пик '
+                f'{peak / 1024:8.0f} КБ  {size:9} байт')
@@ -0,0 +1,116 @@
+import base64
+import json
+import os
+import statistics
+import time
+from io import BytesIO
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.images import IMAGE_SIZES, get_variant_name
+from recipes.models import Ingredient, Recipe, Tag, User
+
+
+def get_image_payload(size):
+    """JPEG из шума размером около size байт в виде data URI."""
+    side = 512
+    while True:
+        buffer = BytesIO()
+        Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(
+            buffer, 'JPEG', quality=95)
+        if buffer.tell() >= size:
+            return ('data:image/jpeg;base64,'
+                    + base64.b64encode(buffer.getvalue()).decode())
+        side = int(side * 1.2)
+
+
+class Command(BaseCommand):
+    help = ('Замер загрузки изображения рецепта: время ответа на создание и '
+            'замену изображения, время до готовности вариантов и удаление '
+            'старых файлов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=float, default=5,
+                            help='Размер изображения, МБ')
+        parser.add_argument('--iterations', type=int, default=5)
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Сколько секунд ждать варианты')
+
+    def handle(self, *args, **options):
+        user = User.objects.first()
+        ingredient = Ingredient.objects.first()
+        if user is None or ingredient is None:
+            raise CommandError('Нет данных, запустите generate_data')
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {token.key}',
+                             HTTP_HOST='127.0.0.1')
+        self.timeout = options['timeout']
+        image = get_image_payload(int(options['size'] * 1024 * 1024))
+        self.stdout.write(
+            f'Изображение: {len(image) * 3 / 4 / 1024 / 1024:.1f} МБ, '
+            f'запрос: {len(image) / 1024 / 1024:.1f} МБ base64')
+        payload = {
+            'name': 'Замер загрузки', 'text': 'Замер', 'cooking_time': 10,
+            'tags': list(Tag.objects.values_list('pk', flat=True)[:1]),
+            'ingredients': [{'id': ingredient.pk, 'amount': 1}],
+            'image': image,
+        }
+        results = {'create': [], 'update': [], 'variants': []}
+        left = []
+        for _ in range(options['iterations']):
+            started = time.perf_counter()
+            response = self.send('post', '/api/recipes/', payload)
+            results['create'].append(time.perf_counter() - started)
+            recipe = Recipe.objects.get(pk=response.json()['id'])
+            results['variants'].append(self.wait_variants(recipe, started))
+            old_names = self.get_names(recipe)
+            started = time.perf_counter()
+            self.send('patch', f'/api/recipes/{recipe.pk}/',
+                      {'image': image})
+            results['update'].append(time.perf_counter() - started)
+            self.wait_variants(recipe, started)
+            recipe.refresh_from_db()
+            self.wait_deleted(old_names)
+            new_names = self.get_names(recipe)
+            recipe.delete()
+            left += self.wait_deleted(new_names)
+        for name, values in results.items():
+            self.stdout.write(
+                f'{name:<9} p50 {statistics.median(values) * 1000:8.1f} мс  '
+                f'max {max(values) * 1000:8.1f} мс')
+        self.stdout.write(f'Неудалённых файлов: {len(left)}')
+
+    def send(self, method, url, data):
+        response = getattr(self.client, method)(
+            url, json.dumps(data), content_type='application/json')
+        if response.status_code >= 400:
+            raise CommandError(f'{url}: {response.status_code}')
+        return response
+
+    @staticmethod
+    def get_names(recipe):
+        name = recipe.image.name
+        return [name, *(get_variant_name(name, label, webp)
+                        for label in IMAGE_SIZES for webp in (False, True))]
+
+    def wait_variants(self, recipe, started):
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            recipe.refresh_from_db()
+            if recipe.image_variants_ready:
+                return time.perf_counter() - started
+            time.sleep(0.05)
+        raise CommandError('Варианты изображения не готовы')
+
+    def wait_deleted(self, names):
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            left = [name for name in names if default_storage.exists(name)]
+            if not left:
+                return left
+            time.sleep(0.05)
+        return left
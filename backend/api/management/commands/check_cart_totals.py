@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from .import_data import iter_batches
+from api.cart_totals import get_expected_totals
+from recipes.models import ShoppingCart, ShoppingCartIngredient, User
+
+
+class Command(BaseCommand):
+    help = ('Сверка итогов корзин с самими корзинами, с --fix '
+            'расхождения пересчитываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        user_ids = User.objects.filter(
+            Q(pk__in=ShoppingCart.objects.values('user_id'))
+            | Q(pk__in=ShoppingCartIngredient.objects.values('user_id'))
+        ).values_list('pk', flat=True).order_by('pk')
+        checked = broken = 0
+        for batch in iter_batches(user_ids.iterator(),
+                                  options['batch_size']):
+            checked += len(batch)
+            expected = get_expected_totals(batch)
+            actual = {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount in
+                ShoppingCartIngredient.objects.filter(
+                    user_id__in=batch
+                ).values_list('user_id', 'ingredient_id', 'amount')
+            }
+            mismatched = {user_id for user_id, _ in
+                          expected.keys() ^ actual.keys()}
+            mismatched.update(
+                user_id for (user_id, ingredient_id), amount
+                in expected.items()
+                if actual.get((user_id, ingredient_id)) != amount)
+            broken += len(mismatched)
+            if mismatched and options['fix']:
+                with transaction.atomic():
+                    ShoppingCartIngredient.objects.filter(
+                        user_id__in=mismatched).delete()
+                    ShoppingCartIngredient.objects.bulk_create(
+                        ShoppingCartIngredient(
+                            user_id=user_id, ingredient_id=ingredient_id,
+                            amount=amount)
+                        for (user_id, ingredient_id), amount
+                        in expected.items() if user_id in mismatched)
+        action = 'исправлено' if options['fix'] else 'с расхождениями'
+        self.stdout.write(
+            f'Проверено пользователей: {checked}, {action}: {broken}')
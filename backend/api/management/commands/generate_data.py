@@ -0,0 +1,222 @@
+import random
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from api import cache, cart_totals
+from api.counters import COUNTERS, recount
+from api.ingredient_index import ingredient_index
+from api.management.commands.import_data import iter_batches
+from api.recipe_index import recipe_index
+from api.search import refresh_search_documents
+from recipes.models import (FavoriteRecipe, FeedItem, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart,
+                            Subscribe, Tag, User)
+
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+WORDS = ('быстрый', 'домашний', 'пряный', 'сливочный', 'летний', 'острый',
+         'овощной', 'сырный', 'лесной', 'печёный', 'томлёный', 'хрустящий')
+IMAGE_NAME = 'static/recipe/generated.png'
+
+
+def get_cum_weights(count, exponent):
+    """Накопленные веса степенного распределения: элемент с рангом i
+    выбирается с вероятностью, пропорциональной 1 / (i + 1) ** exponent.
+    """
+    total = 0
+    weights = []
+    for rank in range(count):
+        total += 1 / (rank + 1) ** exponent
+        weights.append(total)
+    return weights
+
+
+def sample_pairs(rng, total, left, right, cum_left, cum_right,
+                 exclude_same=False):
+    """total различных пар индексов (left, right) со степенными весами."""
+    limit = left * right - (min(left, right) if exclude_same else 0)
+    total = min(total, limit)
+    pairs = set()
+    while len(pairs) < total:
+        needed = total - len(pairs)
+        for pair in zip(
+                rng.choices(range(left), cum_weights=cum_left, k=needed),
+                rng.choices(range(right), cum_weights=cum_right, k=needed)):
+            if not (exclude_same and pair[0] == pair[1]):
+                pairs.add(pair)
+    return pairs
+
+
+class Command(BaseCommand):
+    help = ('Генерация синтетических пользователей, рецептов, избранного, '
+            'корзин и подписок со степенным распределением')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=10000)
+        parser.add_argument('--carts', type=int, default=3000)
+        parser.add_argument('--subscriptions', type=int, default=2000)
+        parser.add_argument('--exponent', type=float, default=1.1,
+                            help='Показатель степенного распределения')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Данные с префиксом {prefix} уже есть, укажите другой '
+                f'--prefix')
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+
+        users = self.create_users(prefix, options['users'])
+        tags = self.create_tags(prefix, options['tags'])
+        ingredients = self.create_ingredients(prefix, options['ingredients'])
+        recipes = self.create_recipes(prefix, users, tags, ingredients)
+        self.create_relations(users, recipes)
+        self.refresh_derived(recipes)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(users)}, рецептов: {len(recipes)}, '
+            f'ингредиентов: {len(ingredients)}, тегов: {len(tags)} '
+            f'за {elapsed:.1f} с'))
+
+    def bulk_create(self, model, objs, **kwargs):
+        for batch in iter_batches(objs, self.batch_size):
+            model.objects.bulk_create(batch, **kwargs)
+
+    def weights(self, count):
+        return get_cum_weights(count, self.options['exponent'])
+
+    def create_users(self, prefix, count):
+        password = make_password(prefix)
+        self.bulk_create(User, (
+            User(username=f'{prefix}_{number}',
+                 email=f'{prefix}_{number}@example.com',
+                 first_name=f'Имя {number}',
+                 last_name=f'Фамилия {number}',
+                 password=password)
+            for number in range(count)))
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}_').order_by('pk').values_list(
+            'pk', flat=True))
+
+    def create_tags(self, prefix, count):
+        colors = set(Tag.objects.values_list('color', flat=True))
+        tags = []
+        for number in range(count):
+            color = None
+            while color is None or color in colors:
+                color = f'#{self.rng.randrange(0x1000000):06X}'
+            colors.add(color)
+            tags.append(Tag(name=f'Тег {prefix} {number}',
+                            slug=f'{prefix}-{number}', color=color))
+        Tag.objects.bulk_create(tags)
+        return list(Tag.objects.filter(
+            slug__startswith=f'{prefix}-').order_by('pk').values_list(
+            'pk', flat=True))
+
+    def create_ingredients(self, prefix, count):
+        self.bulk_create(Ingredient, (
+            Ingredient(name=f'ингредиент {prefix} {number}',
+                       measurement_unit=self.rng.choice(UNITS))
+            for number in range(count)), ignore_conflicts=True)
+        return list(Ingredient.objects.filter(
+            name__startswith=f'ингредиент {prefix} ').order_by(
+            'pk').values_list('pk', flat=True))
+
+    def create_recipes(self, prefix, users, tags, ingredients):
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = BytesIO()
+            Image.new('RGB', (64, 64), (200, 120, 40)).save(buffer, 'PNG')
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        authors = self.rng.choices(users, cum_weights=self.weights(
+            len(users)), k=self.options['recipes'])
+        self.bulk_create(Recipe, (
+            Recipe(author_id=author_id,
+                   name=f'{prefix} {" ".join(self.rng.sample(WORDS, 2))} '
+                        f'{number}',
+                   text=' '.join(self.rng.choices(WORDS, k=60)),
+                   image=IMAGE_NAME,
+                   cooking_time=self.rng.randint(5, 180))
+            for number, author_id in enumerate(authors)))
+        recipes = list(Recipe.objects.filter(
+            author_id__in=users).order_by('pk').values_list('pk', flat=True))
+
+        per_recipe = self.options['ingredients_per_recipe']
+        tag_weights = self.weights(len(tags))
+        ingredient_weights = self.weights(len(ingredients))
+        tag_rows = []
+        ingredient_rows = []
+        for recipe_id in recipes:
+            tag_rows.extend(
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for tag_id in set(self.rng.choices(
+                    tags, cum_weights=tag_weights,
+                    k=self.rng.randint(1, 3))))
+            count = self.rng.randint(max(1, per_recipe // 2),
+                                     per_recipe * 3 // 2 or 1)
+            ingredient_rows.extend(
+                IngredientInRecipe(recipe_id=recipe_id,
+                                   ingredient_id=ingredient_id,
+                                   amount=self.rng.randint(1, 500))
+                for ingredient_id in set(self.rng.choices(
+                    ingredients, cum_weights=ingredient_weights, k=count)))
+        self.bulk_create(Recipe.tags.through, tag_rows)
+        self.bulk_create(IngredientInRecipe, ingredient_rows)
+        return recipes
+
+    def create_relations(self, users, recipes):
+        user_weights = self.weights(len(users))
+        recipe_weights = self.weights(len(recipes))
+        for model, total in ((FavoriteRecipe, self.options['favorites']),
+                             (ShoppingCart, self.options['carts'])):
+            self.bulk_create(model, (
+                model(user_id=users[user], recipe_id=recipes[recipe])
+                for user, recipe in sample_pairs(
+                    self.rng, total, len(users), len(recipes),
+                    user_weights, recipe_weights)))
+        self.bulk_create(Subscribe, (
+            Subscribe(user_id=users[user], author_id=users[author])
+            for user, author in sample_pairs(
+                self.rng, self.options['subscriptions'], len(users),
+                len(users), user_weights, user_weights, exclude_same=True)))
+
+    def refresh_derived(self, recipes):
+        """Данные, которые при обычной работе поддерживают сигналы."""
+        for model, field, related_model, related_field in COUNTERS:
+            recount(model, field, related_model, related_field,
+                    self.batch_size)
+        limit = getattr(settings, 'FEED_FANOUT_LIMIT', 1000)
+        self.bulk_create(FeedItem, (
+            FeedItem(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for user_id, recipe_id, pub_date in Subscribe.objects.filter(
+                author__followers_count__lte=limit,
+                author__recipes__isnull=False,
+            ).values_list('user_id', 'author__recipes__id',
+                          'author__recipes__pub_date').iterator()),
+            ignore_conflicts=True)
+        User.objects.filter(followers_count__gt=limit).update(
+            feed_complete=False)
+        for batch in iter_batches(recipes, self.batch_size):
+            refresh_search_documents(batch)
+            # Корзины с новыми рецептами созданы этим же запуском.
+            cart_totals.add_recipes(batch)
+        recipe_index.invalidate()
+        ingredient_index.invalidate()
+        cache.invalidate('recipes', 'tags', 'ingredients')
@@ -0,0 +1,231 @@
+import csv
+import json
+import os
+import time
+from collections import Counter
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api import cache
+from api.counters import change_counters
+from api.feed import fan_out_recipes, get_fanout_limit
+from api.recipe_index import recipe_index
+from api.search import schedule_search_refresh
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag, User
+
+JSON_READ_SIZE = 64 * 1024
+
+
+def iter_json(file):
+    """Объекты из JSON-массива или JSON Lines без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[':
+            position += 1
+        if buffer[position:position + 1] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                if buffer[position:].strip():
+                    raise CommandError('Некорректный JSON')
+                return
+            chunk = file.read(JSON_READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def iter_csv_ingredients(file):
+    for row in csv.reader(file):
+        if len(row) < 2 or row[:2] == ['name', 'measurement_unit']:
+            continue
+        yield {'name': row[0].strip(), 'measurement_unit': row[1].strip()}
+
+
+def iter_batches(items, size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Импорт ингредиентов или рецептов из CSV/JSON пачками; '
+            'повторный запуск не создаёт дубликатов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .csv, .json или .jsonl')
+        parser.add_argument('--model', choices=('ingredients', 'recipes'),
+                            default='ingredients')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--copy', action='store_true',
+                            help='Загрузить CSV с ингредиентами через '
+                                 'COPY (только PostgreSQL)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        extension = os.path.splitext(path)[1].lower()
+        started = time.monotonic()
+        with open(path, encoding='utf-8', newline='') as file:
+            if options['model'] == 'recipes':
+                if extension == '.csv':
+                    raise CommandError('Рецепты импортируются только из JSON')
+                total = self.import_recipes(iter_json(file),
+                                            options['batch_size'])
+            elif options['copy']:
+                if extension != '.csv' or connection.vendor != 'postgresql':
+                    raise CommandError(
+                        '--copy работает только с CSV и PostgreSQL')
+                total = self.copy_ingredients(file)
+            else:
+                items = (iter_csv_ingredients(file) if extension == '.csv'
+                         else iter_json(file))
+                total = self.import_ingredients(items, options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано записей: {total} за {elapsed:.1f} с '
+            f'({total / elapsed if elapsed else total:.0f} в секунду)'))
+
+    def import_ingredients(self, items, batch_size):
+        total = 0
+        for batch in iter_batches(items, batch_size):
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=item['name'],
+                            measurement_unit=item['measurement_unit'])
+                 for item in batch),
+                ignore_conflicts=True)
+            total += len(batch)
+        cache.invalidate('ingredients', 'recipes')
+        return total
+
+    def copy_ingredients(self, file):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredients_import '
+                '(name varchar(100), measurement_unit varchar(15)) '
+                'ON COMMIT DROP')
+            cursor.cursor.copy_expert(
+                'COPY ingredients_import FROM STDIN WITH (FORMAT csv)', file)
+            cursor.execute(
+                f'INSERT INTO {Ingredient._meta.db_table} '
+                f'(name, measurement_unit) '
+                f'SELECT DISTINCT name, measurement_unit '
+                f'FROM ingredients_import '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING')
+            cursor.execute('SELECT count(*) FROM ingredients_import')
+            total, = cursor.fetchone()
+        cache.invalidate('ingredients', 'recipes')
+        return total
+
+    def import_recipes(self, items, batch_size):
+        """Рецепты с тегами и ингредиентами.
+
+        Рецепт с тем же автором и названием считается уже загруженным.
+        Авторы ищутся по email, теги — по slug, ингредиенты — по названию
+        и единице измерения (недостающие создаются).
+        """
+        total = 0
+        for batch in iter_batches(items, batch_size):
+            with transaction.atomic():
+                self.import_recipe_batch(batch)
+            total += len(batch)
+        recipe_index.invalidate()
+        cache.invalidate('recipe-list')
+        return total
+
+    def import_recipe_batch(self, batch):
+        authors = dict(User.objects.filter(
+            email__in={item['author'] for item in batch}
+        ).values_list('email', 'id'))
+        tags = dict(Tag.objects.filter(
+            slug__in={slug for item in batch for slug in item['tags']}
+        ).values_list('slug', 'id'))
+        keys = {(ingredient['name'], ingredient['measurement_unit'])
+                for item in batch for ingredient in item['ingredients']}
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=unit)
+             for name, unit in keys),
+            ignore_conflicts=True)
+        ingredients = {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.filter(
+                name__in={name for name, _ in keys}
+            ).values_list('id', 'name', 'measurement_unit')
+        }
+        existing = set(Recipe.objects.filter(
+            author_id__in=authors.values(),
+            name__in={item['name'] for item in batch}
+        ).values_list('author_id', 'name'))
+        recipes = []
+        for item in batch:
+            author_id = authors.get(item['author'])
+            if author_id is None:
+                raise CommandError(f'Автор {item["author"]} не найден')
+            if (author_id, item['name']) in existing:
+                continue
+            existing.add((author_id, item['name']))
+            recipes.append((item, Recipe(
+                author_id=author_id, name=item['name'], text=item['text'],
+                cooking_time=item['cooking_time'],
+                image=item.get('image', ''))))
+        if not recipes:
+            return []
+        Recipe.objects.bulk_create(recipe for _, recipe in recipes)
+        # SQLite не возвращает id из bulk_create: пара (автор, название)
+        # в пачке уникальна, по ней id и находятся.
+        ids = {
+            (author_id, name): pk
+            for pk, author_id, name in Recipe.objects.filter(
+                author_id__in={recipe.author_id for _, recipe in recipes},
+                name__in={recipe.name for _, recipe in recipes},
+            ).values_list('id', 'author_id', 'name')
+        }
+        tag_rows = []
+        ingredient_rows = []
+        for item, recipe in recipes:
+            recipe.pk = ids[recipe.author_id, recipe.name]
+            tag_rows.extend(
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tags[slug])
+                for slug in item['tags'] if slug in tags)
+            ingredient_rows.extend(
+                IngredientInRecipe(
+                    recipe_id=recipe.pk,
+                    ingredient_id=ingredients[
+                        (ingredient['name'], ingredient['measurement_unit'])],
+                    amount=ingredient['amount'])
+                for ingredient in item['ingredients'])
+        Recipe.tags.through.objects.bulk_create(tag_rows,
+                                                ignore_conflicts=True)
+        IngredientInRecipe.objects.bulk_create(ingredient_rows,
+                                               ignore_conflicts=True)
+        created = [recipe.pk for _, recipe in recipes]
+        self.recipes_created(created, [recipe for _, recipe in recipes])
+        return created
+
+    @staticmethod
+    def recipes_created(recipe_ids, recipes):
+        """Счётчики, ленты и поиск для новых рецептов: bulk_create не
+        отправляет сигналов.
+        """
+        change_counters(User, 'recipes_count',
+                        Counter(recipe.author_id for recipe in recipes))
+        fanout_authors = set(User.objects.filter(
+            pk__in={recipe.author_id for recipe in recipes},
+            followers_count__lte=get_fanout_limit(),
+        ).values_list('pk', flat=True))
+        fanout_ids = [recipe.pk for recipe in recipes
+                      if recipe.author_id in fanout_authors]
+        if fanout_ids:
+            fan_out_recipes(fanout_ids)
+        schedule_search_refresh(*recipe_ids)
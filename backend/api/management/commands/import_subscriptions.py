@@ -0,0 +1,60 @@
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from .import_data import iter_batches, iter_json
+from api.subscriptions import USER_KEYS, import_pairs
+
+
+def iter_csv_pairs(file):
+    for row in csv.reader(file):
+        if len(row) < 2 or row[:2] == ['user', 'author']:
+            continue
+        yield row[0].strip(), row[1].strip()
+
+
+def iter_json_pairs(file):
+    for item in iter_json(file):
+        yield item['user'], item['author']
+
+
+class Command(BaseCommand):
+    help = ('Импорт подписок из пар (подписчик, автор) в CSV/JSON пачками; '
+            'повторный запуск не создаёт дубликатов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .csv, .json или .jsonl')
+        parser.add_argument('--key', choices=USER_KEYS, default='email',
+                            help='Поле, которым заданы пользователи')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        extension = os.path.splitext(path)[1].lower()
+        key = options['key']
+        started = time.monotonic()
+        total = created = 0
+        with open(path, encoding='utf-8', newline='') as file:
+            pairs = (iter_csv_pairs(file) if extension == '.csv'
+                     else iter_json_pairs(file))
+            for batch in iter_batches(pairs, options['batch_size']):
+                if key == 'id':
+                    try:
+                        batch = [(int(user), int(author))
+                                 for user, author in batch]
+                    except ValueError:
+                        raise CommandError('id должны быть целыми числами')
+                created += len(import_pairs(batch, key))
+                total += len(batch)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Обработано {total}, создано {created} '
+                    f'({total / elapsed if elapsed else total:.0f} в '
+                    f'секунду)')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано пар: {total}, создано подписок: {created} за '
+            f'{elapsed:.1f} с ({total / elapsed if elapsed else total:.0f} '
+            f'в секунду)'))
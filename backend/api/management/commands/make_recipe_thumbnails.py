@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.images import make_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных копий изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Пересоздать и уже готовые копии')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants_ready=False)
+        total = 0
+        for pk, name in recipes.values_list('pk', 'image').iterator():
+            make_variants(pk, name)
+            total += 1
+        self.stdout.write(f'Обработано изображений: {total}')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.counters import COUNTERS, recount
+from api.feed import refresh_feed_state
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт счётчиков избранного, рецептов и подписчиков; '
+            'после него дозаполняются ленты авторов, которые опустились '
+            'до FEED_FANOUT_LIMIT подписчиков')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for model, field, related_model, related_field in COUNTERS:
+            updated = recount(model, field, related_model, related_field,
+                              options['batch_size'])
+            self.stdout.write(
+                f'{model.__name__}.{field}: обновлено {updated}')
+        self.stdout.write(
+            f'Дозаполнены ленты авторов: {refresh_feed_state()}')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import get_stats
+
+
+class Command(BaseCommand):
+    help = 'Попадания и промахи кеша ответов API'
+
+    def handle(self, *args, **kwargs):
+        stats = get_stats()
+        self.stdout.write(
+            f'hits: {stats["hits"]}\n'
+            f'misses: {stats["misses"]}\n'
+            f'hit ratio: {stats["hit_ratio"]:.2%}'
+        )
@@ -0,0 +1,207 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+from .cache import get_stats, is_shared
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+current_request = ContextVar('current_request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} '
+                         f'{cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.total}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_time = 0
+        self.serializer_time = 0
+        self.response_bytes = 0
+
+
+class Registry:
+    """Метрики запросов в памяти процесса, сгруппированные по view.
+
+    У каждого воркера gunicorn свой реестр, а /metrics отвечает тот
+    воркер, которому достался запрос. Поэтому у всех значений есть метка
+    worker с pid процесса: у каждого воркера свои монотонные счётчики,
+    и rate() считается по ним, а не по скачущей сумме.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, request_metrics, duration, size):
+        with self._lock:
+            metrics = self._views.setdefault(view, ViewMetrics())
+            metrics.duration.observe(duration)
+            metrics.queries.observe(request_metrics.query_count)
+            metrics.db_time += request_metrics.db_time
+            metrics.serializer_time += request_metrics.serializer_time
+            metrics.response_bytes += size
+
+    def render(self):
+        lines = [
+            '# TYPE foodgram_request_duration_seconds histogram',
+            '# TYPE foodgram_request_queries histogram',
+            '# TYPE foodgram_request_db_seconds_total counter',
+            '# TYPE foodgram_request_serializer_seconds_total counter',
+            '# TYPE foodgram_response_bytes_total counter',
+        ]
+        worker = f'worker="{os.getpid()}"'
+        with self._lock:
+            for view, metrics in sorted(self._views.items()):
+                labels = f'{worker},view="{view}"'
+                lines.extend(metrics.duration.render(
+                    'foodgram_request_duration_seconds', labels))
+                lines.extend(metrics.queries.render(
+                    'foodgram_request_queries', labels))
+                lines.append(f'foodgram_request_db_seconds_total{{{labels}}} '
+                             f'{metrics.db_time}')
+                lines.append(
+                    f'foodgram_request_serializer_seconds_total{{{labels}}} '
+                    f'{metrics.serializer_time}')
+                lines.append(f'foodgram_response_bytes_total{{{labels}}} '
+                             f'{metrics.response_bytes}')
+        # Счётчики кеша лежат в самом кеше: в общем они общие для всех
+        # воркеров, в памяти процесса — свои у каждого.
+        stats = get_stats()
+        labels = '' if is_shared() else f'{{{worker}}}'
+        lines.append('# TYPE foodgram_response_cache_hits_total counter')
+        lines.append(
+            f'foodgram_response_cache_hits_total{labels} {stats["hits"]}')
+        lines.append('# TYPE foodgram_response_cache_misses_total counter')
+        lines.append(
+            f'foodgram_response_cache_misses_total{labels} '
+            f'{stats["misses"]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0
+        self.serializer_time = 0
+        self.serializer_depth = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.query_count += 1
+            self.statements[sql] += 1
+
+
+class TimedSerializerMixin:
+    """Учитывает время сериализации верхнего уровня в метриках запроса."""
+
+    def to_representation(self, instance):
+        metrics = current_request.get()
+        if metrics is None or metrics.serializer_depth:
+            return super().to_representation(instance)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+            metrics.serializer_depth -= 1
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view = getattr(match.func, 'cls', None)
+    if view is None:
+        return match.view_name
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view.__name__}.{action}'
+
+
+class MetricsMiddleware:
+    """Время, число и длительность SQL-запросов, сериализация и размер
+    ответа для каждого view; заголовок Server-Timing и предупреждение
+    при превышении METRICS_QUERY_BUDGET запросов.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        duration = time.perf_counter() - started
+        size = 0 if response.streaming else len(response.content)
+        view = get_view_name(request)
+        registry.observe(view, metrics, duration, size)
+        response['Server-Timing'] = (
+            f'app;dur={duration * 1000:.1f}, '
+            f'db;dur={metrics.db_time * 1000:.1f};'
+            f'desc="{metrics.query_count} queries", '
+            f'ser;dur={metrics.serializer_time * 1000:.1f}')
+        budget = getattr(settings, 'METRICS_QUERY_BUDGET', 30)
+        if metrics.query_count > budget:
+            repeated = [
+                f'{count} x {sql}'
+                for sql, count in metrics.statements.most_common(5)
+                if count > 1
+            ]
+            logger.warning(
+                '%s: %s SQL-запросов при бюджете %s\n%s', view,
+                metrics.query_count, budget, '\n'.join(repeated))
+        return response
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,56 @@
+from django.conf import settings
+
+from .cache import get_cache, get_versions, is_enabled
+from .replicas import primary_if_changed
+from recipes.models import FavoriteRecipe, ShoppingCart, Subscribe
+
+
+def load_user_sets(user):
+    return (
+        set(FavoriteRecipe.objects.filter(
+            user=user).values_list('recipe_id', flat=True)),
+        set(ShoppingCart.objects.filter(
+            user=user).values_list('recipe_id', flat=True)),
+        set(Subscribe.objects.filter(
+            user=user).values_list('author_id', flat=True)),
+    )
+
+
+def get_user_sets(user):
+    """Избранное, корзина и подписки пользователя в виде множеств id.
+
+    Без общего кеша множества читаются из базы на каждый запрос: версию
+    user:{pk} меняет только воркер, обработавший изменение.
+    """
+    if not is_enabled():
+        return load_user_sets(user)
+    version, = get_versions([f'user:{user.pk}'])
+    key = f'user-sets:{user.pk}:{version}'
+    sets = get_cache().get(key)
+    if sets is None:
+        with primary_if_changed([version]):
+            sets = load_user_sets(user)
+        get_cache().set(key, sets,
+                        getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+    return sets
+
+
+def get_items(data):
+    if isinstance(data, list):
+        return data
+    if 'results' in data:
+        return data['results']
+    return [data]
+
+
+def overlay_recipes(data, user):
+    favorites, cart, following = get_user_sets(user)
+    for recipe in get_items(data):
+        if 'is_favorited' in recipe:
+            recipe['is_favorited'] = recipe['id'] in favorites
+        if 'is_in_shopping_cart' in recipe:
+            recipe['is_in_shopping_cart'] = recipe['id'] in cart
+        if 'author' in recipe:
+            recipe['author']['is_subscribed'] = (
+                recipe['author']['id'] in following)
+    return data
@@ -1,5 +1,169 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from functools import partial
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def encode_cursor(pub_date, pk):
+    value = f'{pub_date.isoformat()}|{pk}'
+    return urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(value):
+    try:
+        value = urlsafe_b64decode(value.encode()).decode()
+        pub_date, pk = value.split('|')
+        pub_date, pk = parse_datetime(pub_date), int(pk)
+    except (DecodeError, UnicodeDecodeError, ValueError):
+        pub_date = None
+    if pub_date is None:
+        raise NotFound('Неверный курсор')
+    return pub_date, pk
+
+
+def keyset_filter(queryset, position, date_field='pub_date',
+                  pk_field='pk'):
+    """Записи строго после position при сортировке по убыванию."""
+    if position is None:
+        return queryset
+    pub_date, pk = position
+    return queryset.filter(
+        Q(**{f'{date_field}__lt': pub_date})
+        | Q(**{date_field: pub_date, f'{pk_field}__lt': pk})
+    )
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация по (pub_date, id) без OFFSET и COUNT(*)."""
+
+    page_size = 10
+    max_page_size = 100
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_position(self, request):
+        value = request.query_params.get(self.cursor_query_param)
+        if not value:
+            return None
+        return decode_cursor(value)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        rows = list(keyset_filter(
+            queryset, self.get_position(request)
+        ).order_by('-pub_date', '-pk')[:page_size + 1])
+        page = rows[:page_size]
+        self.next_position = None
+        if len(rows) > page_size:
+            self.next_position = (page[-1].pub_date, page[-1].pk)
+        return page
+
+    def get_next_link(self):
+        url = self.request.build_absolute_uri()
+        if self.next_position is None:
+            return None
+        return replace_query_param(url, self.cursor_query_param,
+                                   encode_cursor(*self.next_position))
+
+    def get_first_link(self):
+        return remove_query_param(self.request.build_absolute_uri(),
+                                  self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'results': data,
+        })
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который берёт COUNT(*) из кеша, если задан ключ."""
+
+    def __init__(self, *args, cache_key=None, cache_timeout=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_key = cache_key
+        self.cache_timeout = cache_timeout
+
+    @cached_property
+    def count(self):
+        if self.cache_key is None:
+            return super().count
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = super().count
+            cache.set(self.cache_key, count, self.cache_timeout)
+        return count
 
 
 class MyPagination(PageNumberPagination):
+    """Постраничная пагинация с курсорным режимом по ?cursor=.
+
+    Курсор задаёт порядок (pub_date, id), поэтому вместе с ?ordering= и
+    ?search= (сортировка по релевантности) он не принимается.
+    Число записей при RECIPE_COUNT_CACHE_TIMEOUT > 0 кешируется по
+    набору фильтров, чтобы не выполнять COUNT(*) на каждый запрос.
+    """
+
     page_size_query_param = 'limit'
+    keyset_pagination_class = KeysetPagination
+    keyset_incompatible_params = ('ordering', 'search')
+    user_scoped_params = ('is_favorited', 'is_in_shopping_cart')
+    count_ignored_params = ('page', 'limit')
+
+    def get_count_cache_key(self, request):
+        params = sorted(
+            (key, sorted(request.query_params.getlist(key)))
+            for key in request.query_params
+            if key not in self.count_ignored_params
+        )
+        if any(key in self.user_scoped_params for key, _ in params):
+            params.append(('user', request.user.pk))
+        digest = md5(repr((request.path, params)).encode()).hexdigest()
+        return f'count:{digest}'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        cursor_param = self.keyset_pagination_class.cursor_query_param
+        if cursor_param in request.query_params:
+            conflicts = [param for param in self.keyset_incompatible_params
+                         if request.query_params.get(param)]
+            if conflicts:
+                raise ValidationError({cursor_param: (
+                    f'Курсор сортирует по дате публикации и не сочетается '
+                    f'с {", ".join(conflicts)}')})
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        timeout = getattr(settings, 'RECIPE_COUNT_CACHE_TIMEOUT', 0)
+        if timeout:
+            self.django_paginator_class = partial(
+                CachedCountPaginator,
+                cache_key=self.get_count_cache_key(request),
+                cache_timeout=timeout)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,121 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from .deferred import run_after_commit
+from recipes.models import IngredientInRecipe
+
+
+class RecipeIngredientIndex:
+    """Инвертированный индекс ингредиент -> рецепты в памяти процесса.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    для каждого рецепта — кортеж его ингредиентов. Изменения отдельных
+    рецептов применяются через refresh_recipe(), изменения из других
+    процессов подхватываются по истечении RECIPE_INDEX_TTL секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._recipes_by_ingredient = None
+        self._ingredients_by_recipe = None
+        self._built_at = 0
+
+    def _build(self):
+        recipes_by_ingredient = {}
+        ingredients_by_recipe = {}
+        rows = IngredientInRecipe.objects.order_by(
+            'ingredient_id', 'recipe_id'
+        ).values_list('ingredient_id', 'recipe_id').iterator()
+        for ingredient_id, recipe_id in rows:
+            recipes_by_ingredient.setdefault(
+                ingredient_id, array('q')).append(recipe_id)
+            ingredients_by_recipe.setdefault(recipe_id, []).append(
+                ingredient_id)
+        self._recipes_by_ingredient = recipes_by_ingredient
+        self._ingredients_by_recipe = {
+            recipe_id: tuple(ids)
+            for recipe_id, ids in ingredients_by_recipe.items()
+        }
+        self._built_at = time.monotonic()
+
+    def _ensure_built(self):
+        ttl = getattr(settings, 'RECIPE_INDEX_TTL', 300)
+        expired = time.monotonic() - self._built_at > ttl
+        if self._recipes_by_ingredient is None or expired:
+            self._build()
+
+    def invalidate(self):
+        with self._lock:
+            self._recipes_by_ingredient = None
+
+    def refresh_recipe(self, recipe_id):
+        """Перечитывает ингредиенты одного рецепта из базы."""
+        with self._lock:
+            if self._recipes_by_ingredient is None:
+                return
+            new = tuple(sorted(IngredientInRecipe.objects.filter(
+                recipe_id=recipe_id).values_list('ingredient_id', flat=True)))
+            old = self._ingredients_by_recipe.pop(recipe_id, ())
+            for ingredient_id in set(old) - set(new):
+                recipes = self._recipes_by_ingredient[ingredient_id]
+                position = bisect_left(recipes, recipe_id)
+                if position < len(recipes) and recipes[position] == recipe_id:
+                    del recipes[position]
+            for ingredient_id in set(new) - set(old):
+                insort(self._recipes_by_ingredient.setdefault(
+                    ingredient_id, array('q')), recipe_id)
+            if new:
+                self._ingredients_by_recipe[recipe_id] = new
+
+    def search(self, ingredient_ids, min_coverage=100):
+        """Id рецептов, где есть не меньше min_coverage % ингредиентов.
+
+        Рецепты упорядочены по числу найденных ингредиентов, затем по
+        доле ингредиентов рецепта, которые уже есть у пользователя.
+        """
+        ingredient_ids = set(ingredient_ids)
+        if not ingredient_ids:
+            return []
+        required = max(1, -(-len(ingredient_ids) * min_coverage // 100))
+        with self._lock:
+            self._ensure_built()
+            postings = sorted(
+                (self._recipes_by_ingredient.get(ingredient_id, ())
+                 for ingredient_id in ingredient_ids), key=len)
+            if required == len(postings):
+                matched = set(postings[0]).intersection(*postings[1:])
+                counts = dict.fromkeys(matched, required)
+            else:
+                counts = Counter()
+                for recipes in postings:
+                    counts.update(recipes)
+            # Сортируются группы (найдено, ингредиентов в рецепте), а не
+            # каждый рецепт по составному ключу.
+            groups = defaultdict(list)
+            for recipe_id, found in counts.items():
+                if found >= required:
+                    groups[found, len(
+                        self._ingredients_by_recipe[recipe_id])].append(
+                        recipe_id)
+        recipe_ids = []
+        for key in sorted(groups, key=lambda key: (-key[0],
+                                                   -key[0] / key[1])):
+            recipe_ids.extend(sorted(groups[key], reverse=True))
+        return recipe_ids
+
+
+recipe_index = RecipeIngredientIndex()
+
+
+def refresh_recipes(recipe_ids):
+    for recipe_id in recipe_ids:
+        recipe_index.refresh_recipe(recipe_id)
+
+
+def schedule_refresh(*recipe_ids):
+    run_after_commit(refresh_recipes, recipe_ids)
@@ -0,0 +1,55 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON через orjson, если он установлен, иначе стандартным
+    JSONRenderer. Ответы с отступами (browsable API, ?indent) тоже
+    рендерит стандартный.
+    """
+
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type or '',
+                                             renderer_context or {}):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        if data is None:
+            return b''
+        return orjson.dumps(
+            data, default=self.encoder.default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+
+
+class PassthroughRenderer(BaseRenderer):
+    """Позволяет выбрать формат выгрузки через ?format=.
+
+    Сами данные формирует представление, рендерер лишь отдаёт их как есть;
+    ответы с ошибками сериализуются в JSON.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, (str, bytes)):
+            return data
+        return FastJSONRenderer().render(data)
+
+
+class PlainTextRenderer(PassthroughRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(PassthroughRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFRenderer(PassthroughRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
@@ -0,0 +1,116 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from rest_framework.permissions import SAFE_METHODS
+
+STICKY_PREFIX = 'db-primary:'
+STICKY_COOKIE = 'db_primary'
+
+read_alias = ContextVar('read_alias', default=None)
+
+
+def get_sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+class ReplicaRouter:
+    """Чтения идут в базу, выбранную для текущего запроса в
+    ReplicaReadMixin, по умолчанию и для записи — в default.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+def is_sticky(request):
+    """Пользователь недавно что-то менял и должен видеть свои изменения.
+
+    Отметка приходит в подписанной cookie, поэтому её видит любой воркер;
+    с общим кешем она дублируется там для клиентов без cookie.
+    """
+    user = request.user
+    if user.is_anonymous:
+        return False
+    if request.get_signed_cookie(
+            STICKY_COOKIE, default=None, salt=STICKY_COOKIE,
+            max_age=get_sticky_seconds()) == str(user.pk):
+        return True
+    return (is_cache_shared()
+            and bool(cache.get(STICKY_PREFIX + str(user.pk))))
+
+
+def is_cache_shared():
+    # api.cache сам импортирует этот модуль.
+    from .cache import is_shared
+    return is_shared(DEFAULT_CACHE_ALIAS)
+
+
+def get_read_alias(request):
+    """Реплика для чтения или None, если пользователь недавно что-то
+    менял и должен видеть свои изменения.
+    """
+    replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+    if not replicas or is_sticky(request):
+        return None
+    return random.choice(replicas)
+
+
+@contextmanager
+def primary_if_changed(versions):
+    """Читает из default, если версии групп кеша сменились недавно.
+
+    Реплика могла ещё не получить изменения, а прочитанное сохранится в
+    кеше под новой версией.
+    """
+    changed = time.time_ns() - max(versions) < get_sticky_seconds() * 10**9
+    token = read_alias.set(None) if changed else None
+    try:
+        yield
+    finally:
+        if token is not None:
+            read_alias.reset(token)
+
+
+class ReplicaReadMixin:
+    """Безопасные запросы читают из реплик, а после изменяющего запроса
+    пользователь REPLICA_STICKY_SECONDS секунд читает из default.
+
+    Отметка о записи уходит клиенту в подписанной cookie: кеш в памяти
+    процесса остальные воркеры не видят.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = read_alias.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            read_alias.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            read_alias.set(get_read_alias(request))
+        elif not request.user.is_anonymous and is_cache_shared():
+            cache.set(STICKY_PREFIX + str(request.user.pk), True,
+                      get_sticky_seconds())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        user = getattr(request, 'user', None)
+        if (request.method not in SAFE_METHODS and user is not None
+                and not user.is_anonymous):
+            response.set_signed_cookie(
+                STICKY_COOKIE, str(user.pk), salt=STICKY_COOKIE,
+                max_age=get_sticky_seconds(), httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,93 @@
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.expressions import RawSQL
+
+from .deferred import run_after_commit
+from recipes.models import Recipe
+
+SEARCH_CONFIGS = ('russian', 'english')
+FTS_TABLE = 'recipes_recipe_fts'
+
+
+def get_search_vector():
+    vector = None
+    for config in SEARCH_CONFIGS:
+        for field, weight in (('name', 'A'), ('search_text', 'B')):
+            part = SearchVector(field, config=config, weight=weight)
+            vector = part if vector is None else vector + part
+    return vector
+
+
+def refresh_search_documents(recipe_ids):
+    """Обновляет поисковые документы рецептов после изменения их данных."""
+    recipes = {
+        recipe_id: (name, text)
+        for recipe_id, name, text in Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('pk', 'name', 'text')
+    }
+    names = {recipe_id: [] for recipe_id in recipes}
+    for recipe_id, name in Recipe.ingredients.through.objects.filter(
+            recipe_id__in=recipes).values_list('recipe_id',
+                                               'ingredient__name'):
+        names[recipe_id].append(name)
+    with transaction.atomic():
+        for recipe_id, (name, text) in recipes.items():
+            search_text = ' '.join((text, *names[recipe_id]))
+            documents = Recipe.objects.filter(pk=recipe_id)
+            documents.update(search_text=search_text)
+            if connection.vendor == 'postgresql':
+                documents.update(search_vector=get_search_vector())
+            elif connection.vendor == 'sqlite':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'INSERT OR REPLACE INTO {FTS_TABLE} '
+                        f'(rowid, name, body) VALUES (%s, %s, %s)',
+                        (recipe_id, name, search_text))
+
+
+def schedule_search_refresh(*recipe_ids):
+    """Один пересчёт документа на рецепт после commit, сколько бы раз за
+    транзакцию ни менялись рецепт и его ингредиенты."""
+    run_after_commit(refresh_search_documents, recipe_ids)
+
+
+def remove_search_document(recipe_id):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           (recipe_id,))
+
+
+def get_fts5_query(text):
+    words = (word.replace('"', '') for word in text.split())
+    return ' '.join(f'"{word}"*' for word in words if word)
+
+
+def search_recipes(queryset, text):
+    """Рецепты, подходящие под запрос, от более релевантных к менее."""
+    if connection.vendor == 'postgresql':
+        query = None
+        for config in SEARCH_CONFIGS:
+            part = SearchQuery(text, config=config)
+            query = part if query is None else query | part
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date', '-id')
+    if connection.vendor == 'sqlite':
+        match = get_fts5_query(text)
+        if not match:
+            return queryset.none()
+        # Соединение с FTS-таблицей, а не список id: фильтр и COUNT(*)
+        # охватывают все совпадения.
+        recipe_table = Recipe._meta.db_table
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {recipe_table}.id',
+                   f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        ).order_by(RawSQL(f'bm25({FTS_TABLE}, 10.0, 1.0)', ()),
+                   '-pub_date', '-id')
+    return queryset.filter(search_text__icontains=text).annotate(
+        rank=Value(0, output_field=FloatField()))
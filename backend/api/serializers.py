@@ -1,27 +1,48 @@
-from django.db.models import F
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer
-from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 
+from . import cart_totals
+from .fields import StreamingBase64ImageField
+from .images import get_image_urls, schedule_delete, schedule_variants
+from .metrics import TimedSerializerMixin
+from .recipe_index import schedule_refresh
+from .sparse_fields import SparseFieldsMixin
 from recipes.models import (FavoriteRecipe, Ingredient, IngredientInRecipe,
                             Recipe, ShoppingCart, Subscribe, Tag, TagRecipe,
                             User)
 
+BULK_RECIPES_LIMIT = 100
+BULK_AUTHORS_LIMIT = 100
 
-class TagSerializer(ModelSerializer):
+
+class TagSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                    ModelSerializer):
     class Meta:
         model = Tag
         fields = ('id', 'name', 'slug', 'color',)
 
 
-class IngredientsSerializer(ModelSerializer):
+class IngredientsSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                            ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ('name', 'measurement_unit', 'id')
 
+    def to_representation(self, instance):
+        # Записи ingredient_index уже имеют вид ответа, остаётся выбрать
+        # запрошенные поля.
+        if isinstance(instance, dict):
+            fields = self.fields
+            if len(fields) == len(instance):
+                return instance
+            return {name: instance[name] for name in fields}
+        return super().to_representation(instance)
+
 
-class UsersSerializer(UserCreateSerializer):
+class UsersSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                      UserCreateSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -30,6 +51,8 @@ class UsersSerializer(UserCreateSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -47,30 +70,39 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                       serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     author = UsersSerializer(default=serializers.CurrentUserDefault(),
                              required=False)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     ingredients = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
 
     class Meta:
 
         model = Recipe
-        fields = ('id', 'name', 'text', 'author', 'image', 'ingredients',
-                  'tags', 'pub_date', 'cooking_time', 'is_favorited',
-                  'is_in_shopping_cart',)
+        fields = ('id', 'name', 'text', 'author', 'image', 'images',
+                  'ingredients', 'tags', 'pub_date', 'cooking_time',
+                  'is_favorited', 'is_in_shopping_cart',)
+
+    def to_representation(self, instance):
+        if ('author' in self.fields
+                and hasattr(instance, 'author_is_subscribed')):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
+    def get_images(self, obj):
+        return get_image_urls(obj, self.context.get('request'))
 
     def get_ingredients(self, obj):
-        return obj.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('ingredient_list__amount')
-        )
+        return IngredientRecipeSerializer(
+            obj.ingredient_list.all(), many=True).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -79,6 +111,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         ).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -95,8 +129,8 @@ class EditIngredientsSerializer(ModelSerializer):
         fields = ('id', 'amount')
 
 
-class EditRecipeSerializer(ModelSerializer):
-    image = Base64ImageField()
+class EditRecipeSerializer(TimedSerializerMixin, ModelSerializer):
+    image = StreamingBase64ImageField()
     ingredients = EditIngredientsSerializer(
         source='ingredient_list', many=True)
     tags = serializers.PrimaryKeyRelatedField(
@@ -112,26 +146,57 @@ class EditRecipeSerializer(ModelSerializer):
                   'pub_date', 'cooking_time')
 
     def validate(self, data):
-        ingredients = data['ingredient_list']
-
-        ingredients_list = []
-        for ingr in ingredients:
-            if ingr.get('id'):
-                ingredient = Ingredient.objects.get(id=ingr['id'])
-                if ingredient in ingredients_list:
-                    raise serializers.ValidationError(
-                        'Данный ингредиент уже используется')
-                ingredients_list.append(ingredient)
+        ingredients = data.get('ingredient_list')
+        if ingredients is None:
+            return data
+        ids = [ingredient['id'] for ingredient in ingredients]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Данный ингредиент уже используется')
+        missing = set(ids) - set(Ingredient.objects.in_bulk(ids))
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: '
+                f'{", ".join(map(str, sorted(missing)))}')
         return data
 
     @staticmethod
     def create_ingredient(ingredients, recipe):
-        for ingredient in ingredients:
-            IngredientInRecipe.objects.create(
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
                 recipe=recipe,
-                ingredient_id=ingredient.get('id'),
-                amount=ingredient.get('amount'))
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount'])
+            for ingredient in ingredients
+        )
 
+    @staticmethod
+    def update_ingredient(ingredients, recipe):
+        existing = {
+            row.ingredient_id: row for row in recipe.ingredient_list.all()
+        }
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = set(existing) - set(amounts)
+        if removed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        changed = []
+        for ingredient_id, row in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ('amount',))
+        EditRecipeSerializer.create_ingredient(
+            [ingredient for ingredient in ingredients
+             if ingredient['id'] not in existing],
+            recipe)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredient_list')
         tags = validated_data.pop('tags')
@@ -139,31 +204,37 @@ class EditRecipeSerializer(ModelSerializer):
         user = self.context.get('request').user
         recipe = Recipe.objects.create(**validated_data, author=user)
         recipe.tags.set(tags)
-        for element in ingredients:
-            id = element['id']
-            ingredient = Ingredient.objects.get(pk=id)
-            amount = element['amount']
-            IngredientInRecipe.objects.create(
-                ingredient=ingredient, recipe=recipe, amount=amount)
+        self.create_ingredient(ingredients, recipe)
+        schedule_refresh(recipe.pk)
+        schedule_variants(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        IngredientInRecipe.objects.filter(recipe=instance).delete()
-        TagRecipe.objects.filter(recipe=instance).delete()
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredient_list')
-        instance.tags.set(tags)
-        for element in ingredients:
-            id = element['id']
-            ingredient = Ingredient.objects.get(pk=id)
-            amount = element['amount']
-            IngredientInRecipe.objects.create(
-                ingredient=ingredient, recipe=instance, amount=amount
-            )
-        return super().update(instance, validated_data)
-
-
-class SubscribeSerializer(ModelSerializer):
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredient_list', None)
+        if tags is not None:
+            TagRecipe.objects.filter(recipe=instance).delete()
+            instance.tags.set(tags)
+        if ingredients is not None:
+            with cart_totals.recipe_change(instance.pk):
+                self.update_ingredient(ingredients, instance)
+            schedule_refresh(instance.pk)
+        old_image = instance.image.name
+        if 'image' in validated_data:
+            instance.image_variants_ready = False
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            schedule_variants(instance)
+            if instance.image.name != old_image:
+                schedule_delete(old_image)
+        return instance
+
+
+class SubscribeSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                          ModelSerializer):
+    """Автор из подписок; рецепты заранее кладутся в latest_recipes."""
+
     recipes = serializers.SerializerMethodField(
         read_only=True,
         method_name='get_subs_recipes')
@@ -180,31 +251,43 @@ class SubscribeSerializer(ModelSerializer):
         read_only_fields = ('is_subscribed',)
 
     def get_subs_recipes(self, obj):
-        request = self.context.get('request')
-        recipes = obj.recipes.all()
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
-        return RecipeSerializer(recipes, many=True,
-                                context={'request': request}).data
+        return ShoppingCartAndFavoriteRecipeSerializer(
+            obj.latest_recipes, many=True,
+            context={'request': self.context.get('request')}).data
 
     @staticmethod
     def get_recipes_count(obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return Subscribe.objects.filter(user=user, author=obj.id).exists()
 
 
-class ShoppingCartAndFavoriteRecipeSerializer(ModelSerializer):
+class ShoppingCartAndFavoriteRecipeSerializer(SparseFieldsMixin,
+                                              TimedSerializerMixin,
+                                              ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=BULK_RECIPES_LIMIT)
+
+
+class AuthorIdsSerializer(serializers.Serializer):
+    authors = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=BULK_AUTHORS_LIMIT)
+
+
 class CustomUserCreateSerializer(UsersSerializer):
     password = serializers.CharField(style={"input_type": "password"},
                                      write_only=True)
@@ -0,0 +1,125 @@
+import csv
+import json
+import os
+from io import BytesIO
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingCartIngredient
+
+TITLE = 'Список покупок:'
+EMPTY = 'Список покупок пуст'
+PDF_LINES_PER_PAGE = 45
+PDF_FONT_NAME = 'ShoppingListFont'
+
+
+def get_ingredients(user):
+    """Ингредиенты из корзины пользователя по готовым итогам корзины."""
+    return ShoppingCartIngredient.objects.filter(user=user).values(
+        name=F('ingredient__name'),
+        unit=F('ingredient__measurement_unit'),
+        amount_sum=F('amount'),
+    ).order_by('name').iterator()
+
+
+def format_line(ingredient):
+    return (f'{ingredient["name"]} - {ingredient["amount_sum"]} '
+            f'{ingredient["unit"]}')
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def stream_txt(ingredients):
+    empty = True
+    for ingredient in ingredients:
+        if empty:
+            yield f'{TITLE}\n'
+            empty = False
+        yield f'{format_line(ingredient)}\n'
+    if empty:
+        yield f'{EMPTY}\n'
+
+
+def stream_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for ingredient in ingredients:
+        yield writer.writerow(
+            (ingredient['name'], ingredient['amount_sum'],
+             ingredient['unit']))
+
+
+def stream_json(ingredients):
+    separator = ''
+    yield '['
+    for ingredient in ingredients:
+        yield separator + json.dumps(
+            {'name': ingredient['name'],
+             'amount': ingredient['amount_sum'],
+             'measurement_unit': ingredient['unit']},
+            ensure_ascii=False)
+        separator = ', '
+    yield ']'
+
+
+def check_pdf_font():
+    """Ошибка настройки, если TTF-шрифт для PDF не найден: встроенные
+    шрифты PDF не содержат кириллицы.
+    """
+    font_path = getattr(settings, 'SHOPPING_LIST_FONT', None)
+    if not font_path:
+        raise ImproperlyConfigured(
+            'Не задан SHOPPING_LIST_FONT — TTF-шрифт с кириллицей для '
+            'PDF-выгрузки списка покупок')
+    if not os.path.isfile(font_path):
+        raise ImproperlyConfigured(
+            f'Шрифт SHOPPING_LIST_FONT не найден: {font_path}')
+    return font_path
+
+
+def get_pdf_font():
+    font_path = check_pdf_font()
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, font_path))
+    return PDF_FONT_NAME
+
+
+def render_pdf(ingredients, font):
+    """PDF-документ целиком: reportlab собирает файл только в save(),
+    поэтому документ строится в памяти и отдаётся одним ответом.
+    """
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    lines = stream_txt(ingredients)
+    page = list(islice(lines, PDF_LINES_PER_PAGE))
+    while page:
+        pdf.setFont(font, 12)
+        text = pdf.beginText(40, height - 50)
+        for line in page:
+            text.textLine(line.rstrip('\n'))
+        pdf.drawText(text)
+        pdf.showPage()
+        page = list(islice(lines, PDF_LINES_PER_PAGE))
+    pdf.save()
+    return buffer.getvalue()
+
+
+# Текстовые форматы отдаются потоком по мере чтения корзины.
+STREAMS = {
+    'txt': (stream_txt, 'text/plain; charset=utf-8'),
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'json': (stream_json, 'application/json'),
+}
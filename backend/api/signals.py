@@ -0,0 +1,148 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from . import cache, cart_totals
+from .counters import change_counter
+from .feed import (add_subscriptions_to_feed, change_followers_count,
+                   fan_out_recipe, remove_authors_from_feed,
+                   update_recipe_date)
+from .images import schedule_delete
+from .ingredient_index import ingredient_index
+from .recipe_index import schedule_refresh
+from .search import remove_search_document, schedule_search_refresh
+from recipes.models import (FavoriteRecipe, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingCart, Subscribe, Tag, User)
+
+USER_PUBLIC_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+    cache.invalidate('ingredients', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags_cache(sender, **kwargs):
+    cache.invalidate('tags', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_authors_cache(sender, update_fields=None, **kwargs):
+    if update_fields and not USER_PUBLIC_FIELDS & set(update_fields):
+        return
+    cache.invalidate('recipes')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe_cache(sender, instance, **kwargs):
+    cache.invalidate('recipe-list', f'recipe:{instance.pk}')
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def invalidate_recipe_ingredients_cache(sender, instance, **kwargs):
+    cache.invalidate('recipe-list', f'recipe:{instance.recipe_id}')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags_cache(sender, instance, action, reverse,
+                                 **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        cache.invalidate('recipes')
+    else:
+        cache.invalidate('recipe-list', f'recipe:{instance.pk}')
+
+
+@receiver(post_save, sender=Recipe)
+def update_feed_on_recipe_save(sender, instance, created, **kwargs):
+    if created:
+        fan_out_recipe(instance)
+    else:
+        update_recipe_date(instance)
+
+
+@receiver((post_save, post_delete), sender=FavoriteRecipe)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Subscribe)
+def invalidate_user_sets(sender, instance, **kwargs):
+    cache.invalidate(f'user:{instance.user_id}')
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_cart_totals(sender, instance, created, **kwargs):
+    if created:
+        cart_totals.add_recipes([instance.recipe_id], instance.user_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_cart_totals(sender, instance, **kwargs):
+    cart_totals.remove_recipes([instance.recipe_id], instance.user_id)
+
+
+@receiver(post_save, sender=Subscribe)
+def update_feed_on_subscribe(sender, instance, created, **kwargs):
+    if created:
+        add_subscriptions_to_feed([(instance.user_id, instance.author_id)])
+
+
+@receiver(post_delete, sender=Subscribe)
+def update_feed_on_unsubscribe(sender, instance, **kwargs):
+    remove_authors_from_feed(instance.user_id, [instance.author_id])
+
+
+@receiver((post_save, post_delete), sender=FavoriteRecipe)
+def update_favorites_count(sender, instance, created=False, **kwargs):
+    if kwargs['signal'] is post_save and not created:
+        return
+    change_counter(Recipe, instance.recipe_id, 'favorites_count',
+                   1 if created else -1)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def update_recipes_count(sender, instance, created=False, **kwargs):
+    if kwargs['signal'] is post_save and not created:
+        return
+    change_counter(User, instance.author_id, 'recipes_count',
+                   1 if created else -1)
+
+
+@receiver((post_save, post_delete), sender=Subscribe)
+def update_followers_count(sender, instance, created=False, **kwargs):
+    if kwargs['signal'] is post_save and not created:
+        return
+    change_followers_count({instance.author_id: 1 if created else -1})
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_on_recipe_save(sender, instance, **kwargs):
+    schedule_search_refresh(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def update_search_on_recipe_delete(sender, instance, **kwargs):
+    remove_search_document(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_images(sender, instance, **kwargs):
+    schedule_delete(instance.image.name)
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def update_search_on_ingredients_change(sender, instance, **kwargs):
+    schedule_search_refresh(instance.recipe_id)
+
+
+@receiver(post_save, sender=Ingredient)
+def update_search_on_ingredient_rename(sender, instance, created, **kwargs):
+    if created:
+        return
+    schedule_search_refresh(*instance.recipes.values_list('pk', flat=True))
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def update_recipe_index(sender, instance, **kwargs):
+    schedule_refresh(instance.recipe_id)
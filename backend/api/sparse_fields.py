@@ -0,0 +1,56 @@
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def get_names(request, param):
+    return {
+        name.strip()
+        for value in request.query_params.getlist(param)
+        for name in value.split(',') if name.strip()
+    }
+
+
+def get_field_filter(request):
+    """Проверка, нужно ли поле в ответе, по ?fields= и ?omit=.
+
+    id нужен всегда: по нему в ответ накладываются персональные поля.
+    Для изменяющих запросов ограничений нет.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    fields = get_names(request, FIELDS_PARAM)
+    omit = get_names(request, OMIT_PARAM)
+    if not fields and not omit:
+        return None
+
+    def check(name):
+        return name == 'id' or (
+            (not fields or name in fields) and name not in omit)
+
+    return check
+
+
+def is_requested(request, name):
+    field_filter = get_field_filter(request)
+    return field_filter is None or field_filter(name)
+
+
+class SparseFieldsMixin:
+    """Оставляет в ответе только поля, запрошенные через ?fields= и
+    ?omit=.
+
+    Проверка берётся из контекста, который сериализатор получил при
+    создании (ключ field_filter), поэтому вложенные сериализаторы
+    отдают все свои поля.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        field_filter = kwargs.get('context', {}).get('field_filter')
+        if field_filter is None:
+            return
+        for name in list(self.fields):
+            if not field_filter(name):
+                self.fields.pop(name)
@@ -0,0 +1,119 @@
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from . import cache
+from .feed import (add_subscriptions_to_feed, change_followers_count,
+                   remove_authors_from_feed)
+from recipes.models import Recipe, Subscribe, User
+
+SUBSCRIBE_TABLE = Subscribe._meta.db_table
+USER_TABLE = User._meta.db_table
+USER_KEYS = ('id', 'email', 'username')
+
+
+def follow(user_id, author_ids):
+    """Подписывает пользователя на авторов одним запросом.
+
+    Существующие подписки, несуществующие авторы и подписка на себя
+    пропускаются в SQL. Возвращает id авторов, на которых пользователь
+    подписался.
+    """
+    if not author_ids:
+        return []
+    placeholders = ', '.join(['%s'] * len(author_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {SUBSCRIBE_TABLE} (user_id, author_id) '
+            f'SELECT %s, id FROM {USER_TABLE} '
+            f'WHERE id IN ({placeholders}) AND id <> %s '
+            f'ON CONFLICT (author_id, user_id) DO NOTHING '
+            f'RETURNING author_id',
+            [user_id, *author_ids, user_id])
+        added = [author_id for author_id, in cursor.fetchall()]
+        subscribed([(user_id, author_id) for author_id in added])
+    return added
+
+
+def unfollow(user_id, author_ids):
+    """Отписывает пользователя от авторов, возвращает id тех, от кого
+    он действительно отписался.
+    """
+    if not author_ids:
+        return []
+    placeholders = ', '.join(['%s'] * len(author_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SUBSCRIBE_TABLE} '
+            f'WHERE user_id = %s AND author_id IN ({placeholders}) '
+            f'RETURNING author_id',
+            [user_id, *author_ids])
+        removed = [author_id for author_id, in cursor.fetchall()]
+        if removed:
+            remove_authors_from_feed(user_id, removed)
+            change_followers_count(dict.fromkeys(removed, -1))
+            cache.invalidate(f'user:{user_id}')
+    return removed
+
+
+def import_pairs(pairs, key='id'):
+    """Создаёт подписки из пар (подписчик, автор), заданных полем key
+    пользователя. Неизвестные пользователи, подписки на себя и
+    существующие подписки пропускаются в SQL. Возвращает созданные пары
+    id.
+    """
+    if key not in USER_KEYS:
+        raise ValueError(f'Пользователи задаются одним из полей {USER_KEYS}')
+    if not pairs:
+        return []
+    values = ', '.join(['(%s, %s)'] * len(pairs))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {SUBSCRIBE_TABLE} (user_id, author_id) '
+            f'SELECT follower.id, author.id FROM (VALUES {values}) pair '
+            f'JOIN {USER_TABLE} follower ON follower.{key} = pair.column1 '
+            f'JOIN {USER_TABLE} author ON author.{key} = pair.column2 '
+            f'WHERE follower.id <> author.id '
+            f'ON CONFLICT (author_id, user_id) DO NOTHING '
+            f'RETURNING user_id, author_id',
+            [value for pair in pairs for value in pair])
+        added = cursor.fetchall()
+        subscribed(added)
+    return added
+
+
+def subscribed(pairs):
+    """Ленты, счётчики подписчиков и кеш для новых подписок: сигналы при
+    вставке одним запросом не отправляются.
+    """
+    if not pairs:
+        return
+    add_subscriptions_to_feed(pairs)
+    change_followers_count(Counter(author_id for _, author_id in pairs))
+    cache.invalidate(*{f'user:{user_id}' for user_id, _ in pairs})
+
+
+def get_latest_recipes(author_ids, limit=None):
+    """Последние limit рецептов (без limit — все) каждого из авторов
+    одним запросом: {id автора: [рецепты]}.
+    """
+    latest = defaultdict(list)
+    if not author_ids:
+        return latest
+    ranked = Recipe.objects.filter(author_id__in=author_ids).annotate(
+        recipe_rank=Window(
+            RowNumber(), partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()]),
+    ).order_by().values('id', 'name', 'image', 'cooking_time', 'author_id',
+                        'recipe_rank')
+    sql, params = ranked.query.sql_with_params()
+    query = f'SELECT * FROM ({sql}) ranked'
+    if limit is not None:
+        query += ' WHERE recipe_rank <= %s'
+        params += (limit,)
+    for recipe in Recipe.objects.raw(
+            query + ' ORDER BY author_id, recipe_rank', params):
+        latest[recipe.author_id].append(recipe)
+    return latest
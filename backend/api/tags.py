@@ -0,0 +1,15 @@
+from .cache import get_cache, get_versions, is_enabled
+from recipes.models import Tag
+
+
+def get_tag_ids():
+    """Соответствие slug -> id тегов из кеша."""
+    if not is_enabled():
+        return dict(Tag.objects.values_list('slug', 'id'))
+    version, = get_versions(['tags'])
+    key = f'tag-ids:{version}'
+    tag_ids = get_cache().get(key)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        get_cache().set(key, tag_ids, None)
+    return tag_ids
@@ -0,0 +1,1300 @@
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from base64 import b64encode
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from uuid import UUID
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+
+from .cache import get_cache, is_enabled
+from .compression import brotli
+from .counters import COUNTERS
+from .deferred import PendingIds
+from .feed import backfill_feeds
+from .images import IMAGE_SIZES, delete_images, get_variant_name
+from .overlay import get_user_sets
+from .recipe_index import recipe_index
+from .renderers import FastJSONRenderer
+from .replicas import STICKY_COOKIE
+from .search import refresh_search_documents
+from foodgram.db_backend.health_checks import HealthChecksMixin
+from recipes.models import (FavoriteRecipe, FeedItem, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart,
+                            ShoppingCartIngredient, Subscribe, Tag, User)
+
+PAGE_SIZES = (5, 50)
+
+
+def run_pending_ids():
+    """Выполняет накопленные до commit пересчёты: TestCase не завершает
+    транзакцию, и on_commit сам не срабатывает."""
+    for _, callback in connection.run_on_commit:
+        if isinstance(callback, PendingIds):
+            callback()
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class QueryCountTests(APITestCase):
+    """Число запросов к базе не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass',
+            first_name='Читатель', last_name='Тестовый')
+        tags = [Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}',
+                                   color=f'#00000{number}')
+                for number in range(3)]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(10))
+        ingredients = list(Ingredient.objects.all())
+        for number in range(max(PAGE_SIZES) + 5):
+            author = User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com', password='pass',
+                first_name='Автор', last_name=str(number))
+            Subscribe.objects.create(user=cls.user, author=author)
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', text='Описание', author=author,
+                image='static/recipe/test.png', cooking_time=10)
+            recipe.tags.set(tags[:number % 3 + 1])
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                                   amount=10)
+                for ingredient in ingredients[:number % 5 + 1])
+        cls.recipe = recipe
+
+    def setUp(self):
+        get_cache().clear()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url):
+        get_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+
+    def assert_constant(self, url, expected):
+        for limit in PAGE_SIZES:
+            with self.subTest(limit=limit):
+                self.assertEqual(
+                    self.count_queries(url.format(limit=limit)), expected)
+
+    def test_recipe_list(self):
+        self.assert_constant('/api/recipes/?page=1&limit={limit}', 7)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_recipe_list_without_cache(self):
+        self.assert_constant('/api/recipes/?page=1&limit={limit}', 4)
+
+    def test_recipe_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assert_constant('/api/recipes/?page=1&limit={limit}', 4)
+
+    def test_recipe_detail(self):
+        with self.assertNumQueries(6):
+            get_cache().clear()
+            response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_subscriptions(self):
+        self.assert_constant(
+            '/api/users/subscriptions/?limit={limit}&recipes_limit=3', 3)
+
+
+class RecipeUpdateTests(APITestCase):
+    """Изменение рецепта: частичный PATCH и число запросов, не зависящее
+    от числа ингредиентов."""
+
+    SIZES = (1, 5, 20)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        cls.tags = [Tag.objects.create(name=f'Тег {number}',
+                                       slug=f'tag{number}',
+                                       color=f'#00000{number}')
+                    for number in range(2)]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(2 * max(cls.SIZES)))
+        cls.ingredients = list(Ingredient.objects.values_list('pk',
+                                                              flat=True))
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8), 'red').save(buffer, 'PNG')
+        cls.image = ('data:image/png;base64,'
+                     + b64encode(buffer.getvalue()).decode())
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_authenticate(self.author)
+        self.recipe = self.create_recipe(3)
+
+    def create_recipe(self, size):
+        recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', author=self.author,
+            image='static/recipe/test.png', cooking_time=10)
+        recipe.tags.set(self.tags)
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient_id=pk, amount=10)
+            for pk in self.ingredients[:size])
+        return recipe
+
+    def patch(self, data, recipe=None):
+        recipe = recipe or self.recipe
+        response = self.client.patch(f'/api/recipes/{recipe.pk}/',
+                                     data, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def count_queries(self, send):
+        counts = {}
+        for size in self.SIZES:
+            with CaptureQueriesContext(connection) as queries:
+                send(size)
+            counts[size] = len(queries)
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_partial_update_keeps_tags_and_ingredients(self):
+        self.patch({'name': 'Новое название'})
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(self.recipe.tags.count(), len(self.tags))
+        self.assertEqual(self.recipe.ingredient_list.count(), 3)
+
+    def test_create_queries(self):
+        def create(size):
+            response = self.client.post('/api/recipes/', {
+                'name': f'Рецепт {size}', 'text': 'Описание',
+                'cooking_time': 10, 'image': self.image,
+                'tags': [tag.pk for tag in self.tags],
+                'ingredients': [{'id': pk, 'amount': 20}
+                                for pk in self.ingredients[:size]],
+            }, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+            self.assertEqual(len(response.data['ingredients']), size)
+
+        self.count_queries(create)
+
+    def test_partial_update_queries(self):
+        recipes = {size: self.create_recipe(size) for size in self.SIZES}
+        self.count_queries(lambda size: self.patch(
+            {'name': 'Новое название'}, recipes[size]))
+
+    def test_update_ingredients_queries(self):
+        def update(size):
+            # Все ингредиенты заменяются другими.
+            ingredients = self.ingredients[size:2 * size]
+            self.patch({
+                'tags': [self.tags[0].pk],
+                'ingredients': [{'id': pk, 'amount': 20}
+                                for pk in ingredients],
+            }, recipes[size])
+            self.assertEqual(
+                sorted(recipes[size].ingredient_list.values_list(
+                    'ingredient_id', 'amount')),
+                sorted((pk, 20) for pk in ingredients))
+
+        recipes = {size: self.create_recipe(size) for size in self.SIZES}
+        self.count_queries(update)
+
+
+@override_settings(FEED_FANOUT_LIMIT=1)
+class FeedBackfillTests(APITestCase):
+    """Лента автора, который опустился до FEED_FANOUT_LIMIT подписчиков."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.author, self.first, self.second = (
+            User.objects.create_user(username=name,
+                                     email=f'{name}@example.com',
+                                     password='pass')
+            for name in ('author', 'first', 'second'))
+        for user in (self.first, self.second):
+            self.client.force_authenticate(user)
+            self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', author=self.author,
+            image='static/recipe/test.png', cooking_time=10)
+
+    def get_feed(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_pull_author_recipe_in_feed(self):
+        self.assertFalse(FeedItem.objects.exists())
+        self.assertEqual(self.get_feed(self.second), [self.recipe.pk])
+
+    def test_author_above_limit_marked_incomplete(self):
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 2)
+        self.assertFalse(self.author.feed_complete)
+
+    def test_backfill_when_author_drops_to_limit(self):
+        self.client.force_authenticate(self.first)
+        response = self.client.delete(
+            f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        # До конца фонового дозаполнения рецепты читаются напрямую.
+        self.assertEqual(self.get_feed(self.second), [self.recipe.pk])
+        backfill_feeds([self.author.pk])
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.feed_complete)
+        self.assertEqual(list(FeedItem.objects.values_list(
+            'user', 'recipe')), [(self.second.pk, self.recipe.pk)])
+        self.assertEqual(self.get_feed(self.second), [self.recipe.pk])
+
+    def test_backfill_skips_author_above_limit(self):
+        backfill_feeds([self.author.pk])
+        self.assertFalse(FeedItem.objects.exists())
+
+    def test_backfill_on_subscription_delete(self):
+        Subscribe.objects.filter(user=self.first).delete()
+        self.assertEqual(self.get_feed(self.second), [self.recipe.pk])
+        backfill_feeds([self.author.pk])
+        self.assertTrue(FeedItem.objects.filter(
+            user=self.second, recipe=self.recipe).exists())
+
+
+class CursorPaginationTests(APITestCase):
+    """Курсор задаёт порядок по дате и не сочетается с другим порядком."""
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_cursor_with_ordering_or_search(self):
+        for params in ('ordering=-favorites_count', 'search=суп'):
+            with self.subTest(params=params):
+                response = self.client.get(
+                    f'/api/recipes/?cursor=MjAyNnwx&{params}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.data)
+
+    def test_cursor(self):
+        response = self.client.get('/api/recipes/?cursor=')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('next', response.data)
+
+    def test_by_ingredients_cursor(self):
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        url = f'/api/recipes/by_ingredients/?ingredients={ingredient.pk}'
+        self.assertEqual(self.client.get(f'{url}&cursor=').status_code, 400)
+        response = self.client.get(f'{url}&page=1&limit=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 0)
+
+
+class ShoppingListDownloadTests(APITestCase):
+    """Выгрузка списка покупок во всех форматах."""
+
+    URL = '/api/recipes/download_shopping_cart/?format='
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        recipes = [Recipe.objects.create(
+            name=f'Рецепт {number}', text='Описание', author=cls.user,
+            image='static/recipe/test.png', cooking_time=10)
+            for number in range(2)]
+        carrot = Ingredient.objects.create(name='Морковь',
+                                           measurement_unit='г')
+        salt = Ingredient.objects.create(name='Соль',
+                                         measurement_unit='по вкусу')
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe=recipes[0], ingredient=carrot,
+                               amount=100),
+            IngredientInRecipe(recipe=recipes[1], ingredient=carrot,
+                               amount=50),
+            IngredientInRecipe(recipe=recipes[1], ingredient=salt,
+                               amount=1)])
+        cls.recipes = recipes
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self):
+        for recipe in self.recipes:
+            response = self.client.post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/')
+            self.assertEqual(response.status_code, 201)
+
+    def download(self, export_format):
+        response = self.client.get(self.URL + export_format)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename="shopping_list.{export_format}"')
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    def test_txt(self):
+        self.assertEqual(self.download('txt').decode(),
+                         'Список покупок пуст\n')
+        self.fill_cart()
+        self.assertEqual(self.download('txt').decode(), (
+            'Список покупок:\n'
+            'Морковь - 150 г\n'
+            'Соль - 1 по вкусу\n'))
+
+    def test_csv(self):
+        self.fill_cart()
+        self.assertEqual(self.download('csv').decode().splitlines(), [
+            'name,amount,measurement_unit',
+            'Морковь,150,г',
+            'Соль,1,по вкусу'])
+
+    def test_json(self):
+        self.assertEqual(json.loads(self.download('json')), [])
+        self.fill_cart()
+        self.assertEqual(json.loads(self.download('json')), [
+            {'name': 'Морковь', 'amount': 150, 'measurement_unit': 'г'},
+            {'name': 'Соль', 'amount': 1, 'measurement_unit': 'по вкусу'}])
+
+    def test_pdf(self):
+        self.fill_cart()
+        content = self.download('pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+
+    @override_settings(SHOPPING_LIST_FONT='/nonexistent/font.ttf')
+    def test_pdf_without_font(self):
+        response = self.client.get(self.URL + 'pdf')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('/nonexistent/font.ttf', response.content.decode())
+        for export_format in ('txt', 'csv', 'json'):
+            with self.subTest(export_format=export_format):
+                self.download(export_format)
+
+    @override_settings(SHOPPING_LIST_FONT='/nonexistent/font.ttf')
+    def test_missing_font_is_warning(self):
+        out = StringIO()
+        call_command('check', stdout=out, stderr=out)
+        self.assertIn('api.W001', out.getvalue())
+
+
+class RecipeIndexTests(APITestCase):
+    """Подбор рецептов по ингредиентам: отбор по покрытию, порядок и
+    обновление индекса после изменения рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Морковь', 'Лук', 'Свекла', 'Капуста')]
+        cls.recipes = {}
+        for name, size in (('Пара', 2), ('Четвёрка', 4), ('Одиночка', 1)):
+            recipe = Recipe.objects.create(
+                name=name, text='Описание', author=cls.author,
+                image='static/recipe/test.png', cooking_time=10)
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                                   amount=10)
+                for ingredient in cls.ingredients[:size])
+            cls.recipes[name] = recipe.pk
+        cls.other = Recipe.objects.create(
+            name='Другой', text='Описание', author=cls.author,
+            image='static/recipe/test.png', cooking_time=10)
+        IngredientInRecipe.objects.create(
+            recipe=cls.other, ingredient=cls.ingredients[2], amount=10)
+
+    def setUp(self):
+        get_cache().clear()
+        recipe_index.invalidate()
+        self.addCleanup(recipe_index.invalidate)
+
+    def find(self, params=''):
+        ids = ','.join(str(ingredient.pk)
+                       for ingredient in self.ingredients[:2])
+        response = self.client.get(
+            f'/api/recipes/by_ingredients/?ingredients={ids}{params}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def get_ids(self, *names):
+        return [self.recipes[name] for name in names]
+
+    def test_full_coverage(self):
+        # Сначала рецепт, ингредиенты которого уже все есть.
+        self.assertEqual([recipe['id'] for recipe in self.find()],
+                         self.get_ids('Пара', 'Четвёрка'))
+
+    def test_partial_coverage_and_pages(self):
+        self.assertEqual(
+            [recipe['id'] for recipe in self.find('&min_coverage=50')],
+            self.get_ids('Пара', 'Четвёрка', 'Одиночка'))
+        data = self.find('&min_coverage=50&page=2&limit=2')
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([recipe['id'] for recipe in data['results']],
+                         self.get_ids('Одиночка'))
+
+    def test_refreshed_after_update(self):
+        self.find()
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{self.other.pk}/',
+            {'ingredients': [{'id': ingredient.pk, 'amount': 5}
+                             for ingredient in self.ingredients[:2]]},
+            format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        run_pending_ids()
+        # При равном порядке новые рецепты идут раньше.
+        self.assertEqual([recipe['id'] for recipe in self.find()],
+                         [self.other.pk, *self.get_ids('Пара', 'Четвёрка')])
+
+
+class ImageCleanupTests(APITestCase):
+    """Файлы заменённого изображения и его вариантов удаляются."""
+
+    name = 'static/recipe/old.png'
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.names = [self.name, *(
+            get_variant_name(self.name, label, webp)
+            for label in IMAGE_SIZES for webp in (False, True))]
+        for name in self.names:
+            default_storage.save(name, ContentFile(b'image'))
+
+    def test_delete_unused_image(self):
+        delete_images(self.name)
+        self.assertFalse(any(map(default_storage.exists, self.names)))
+
+    def test_keep_image_in_use(self):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        Recipe.objects.create(name='Рецепт', text='Описание', author=author,
+                              image=self.name, cooking_time=10)
+        delete_images(self.name)
+        self.assertTrue(all(map(default_storage.exists, self.names)))
+
+
+class MakeThumbnailsTests(APITestCase):
+    """make_recipe_thumbnails проходит больше рецептов, чем умещается в
+    одну порцию iterator(), не закрывая соединение, из которого читает."""
+
+    # Размер порции QuerySet.iterator() по умолчанию.
+    CHUNK_SIZE = 2000
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        buffer = BytesIO()
+        Image.new('RGB', (64, 48), 'red').save(buffer, 'PNG')
+        self.name = default_storage.save('static/recipe/real.png',
+                                         ContentFile(buffer.getvalue()))
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', author=author, image=self.name,
+            cooking_time=10)
+        # Файлов остальных изображений нет: их обработка быстро
+        # завершается ошибкой в журнале.
+        Recipe.objects.bulk_create(
+            Recipe(name=f'Рецепт {number}', text='Описание', author=author,
+                   image=f'static/recipe/missing{number}.png',
+                   cooking_time=10)
+            for number in range(self.CHUNK_SIZE))
+
+    def test_more_rows_than_one_chunk(self):
+        out = StringIO()
+        with self.assertLogs('api.images', 'ERROR'):
+            call_command('make_recipe_thumbnails', stdout=out)
+        self.assertIn(f'Обработано изображений: {self.CHUNK_SIZE + 1}',
+                      out.getvalue())
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image_variants_ready)
+        self.assertTrue(all(
+            default_storage.exists(get_variant_name(self.name, label, webp))
+            for label in IMAGE_SIZES for webp in (False, True)))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'план запроса в формате SQLite')
+class TagFilterPlanTests(APITestCase):
+    """Страница рецептов по тегам читается по индексам, без сортировки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        tags = [Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}',
+                                   color=f'#00000{number}')
+                for number in range(3)]
+        for number in range(30):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', text='Описание', author=author,
+                image='static/recipe/test.png', cooking_time=10)
+            recipe.tags.set(tags[:number % 3 + 1])
+        cls.author = author
+
+    def setUp(self):
+        get_cache().clear()
+
+    def get_plan(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        sql = next(query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT "recipes_recipe"."id"')
+                   and 'ORDER BY' in query['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_tags_filter_plan(self):
+        for params in ('tags=tag1', 'tags=tag0&tags=tag2',
+                       f'tags=tag1&author={self.author.pk}', 'cursor='):
+            with self.subTest(params=params):
+                plan = self.get_plan(f'/api/recipes/?limit=6&{params}')
+                self.assertNotIn('SCAN recipes_recipe', plan)
+                self.assertFalse(
+                    [step for step in plan if 'TEMP B-TREE' in step], plan)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'поиск через FTS5')
+class SearchTests(APITestCase):
+    """Поиск видит все совпадения, документ пересчитывается один раз."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        cls.tag = Tag.objects.create(name='Тег', slug='tag', color='#000000')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(15))
+        Ingredient.objects.create(name='Морковь', measurement_unit='г')
+        cls.ingredients = list(Ingredient.objects.values_list('pk',
+                                                              flat=True))
+
+    def setUp(self):
+        get_cache().clear()
+        self.client.force_authenticate(self.author)
+
+    def search(self, text):
+        response = self.client.get(f'/api/recipes/?search={text}&limit=5')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_count_not_truncated(self):
+        Recipe.objects.bulk_create(
+            Recipe(name=f'Суп {number}', text='Описание', author=self.author,
+                   image='static/recipe/test.png', cooking_time=10)
+            for number in range(600))
+        refresh_search_documents(Recipe.objects.values_list('pk', flat=True))
+        data = self.search('суп')
+        self.assertEqual(data['count'], 600)
+        self.assertEqual(len(data['results']), 5)
+
+    def create_recipes(self, *texts):
+        recipes = [Recipe.objects.create(
+            name=name, text=text, author=self.author,
+            image='static/recipe/test.png', cooking_time=10)
+            for name, text in texts]
+        refresh_search_documents([recipe.pk for recipe in recipes])
+        return recipes
+
+    def test_name_ranks_above_text(self):
+        # Более новые рецепты идут раньше при равной релевантности, поэтому
+        # совпадение в названии создаётся первым.
+        in_name, in_text, other = self.create_recipes(
+            ('Борщ', 'Свекла и капуста'),
+            ('Щи', 'Готовится как борщ, но без свеклы'),
+            ('Солянка', 'Копчёности'))
+        data = self.search('борщ')
+        self.assertEqual([recipe['id'] for recipe in data['results']],
+                         [in_name.pk, in_text.pk])
+
+    def test_prefix_and_ingredient_match(self):
+        recipe, = self.create_recipes(('Салат', 'Нарезать'))
+        IngredientInRecipe.objects.create(
+            recipe=recipe, ingredient_id=self.ingredients[-1], amount=10)
+        refresh_search_documents([recipe.pk])
+        for text in ('сала', 'морковь'):
+            with self.subTest(text=text):
+                self.assertEqual(
+                    [found['id'] for found in self.search(text)['results']],
+                    [recipe.pk])
+
+    def count_update_queries(self, ingredients):
+        recipe = Recipe.objects.create(
+            name='Рагу', text='Описание', author=self.author,
+            image='static/recipe/test.png', cooking_time=10)
+        recipe.tags.set([self.tag])
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient_id=pk, amount=10)
+            for pk in ingredients)
+        run_pending_ids()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/api/recipes/{recipe.pk}/',
+                {'ingredients': [{'id': self.ingredients[-1], 'amount': 5}]},
+                format='json')
+            run_pending_ids()
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+
+    def test_refresh_once_per_recipe(self):
+        self.assertEqual(self.count_update_queries(self.ingredients[:3]),
+                         self.count_update_queries(self.ingredients[:15]))
+        self.assertEqual(self.search('морковь')['count'], 2)
+
+
+class ImportDataTests(APITestCase):
+    """Импорт рецептов пачками: без дубликатов, со счётчиками и лентами."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.author, self.follower = (
+            User.objects.create_user(username=name,
+                                     email=f'{name}@example.com',
+                                     password='pass')
+            for name in ('author', 'follower'))
+        Subscribe.objects.create(user=self.follower, author=self.author)
+        Tag.objects.create(name='Тег', slug='tag', color='#000000')
+
+    def import_recipes(self, count):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl',
+                                         encoding='utf-8') as file:
+            for number in range(count):
+                file.write(json.dumps({
+                    'author': self.author.email, 'name': f'Суп {number}',
+                    'text': 'Описание', 'cooking_time': 10,
+                    'tags': ['tag'],
+                    'ingredients': [{'name': 'Морковь',
+                                     'measurement_unit': 'г',
+                                     'amount': number + 1}],
+                }, ensure_ascii=False) + '\n')
+            file.flush()
+            call_command('import_data', file.name, model='recipes',
+                         batch_size=2, stdout=StringIO())
+        run_pending_ids()
+
+    def test_import_twice(self):
+        self.import_recipes(3)
+        self.import_recipes(5)
+        self.assertEqual(Recipe.objects.count(), 5)
+        self.assertEqual(Ingredient.objects.count(), 1)
+        self.assertEqual(
+            sorted(IngredientInRecipe.objects.values_list('amount',
+                                                          flat=True)),
+            [1, 2, 3, 4, 5])
+        self.assertEqual(Recipe.tags.through.objects.count(), 5)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 5)
+        self.assertEqual(FeedItem.objects.filter(user=self.follower).count(),
+                         5)
+        self.client.force_authenticate(self.follower)
+        response = self.client.get('/api/recipes/?search=морковь&limit=10')
+        self.assertEqual(response.data['count'], 5)
+
+
+class CountersTests(APITestCase):
+    """Хранимые счётчики совпадают с пересчётом после изменений через API
+    и импорта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = (
+            User.objects.create_user(username=name,
+                                     email=f'{name}@example.com',
+                                     password='pass')
+            for name in ('author', 'reader'))
+        cls.tag = Tag.objects.create(name='Тег', slug='tag', color='#000000')
+        cls.ingredient = Ingredient.objects.create(name='Морковь',
+                                                   measurement_unit='г')
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8), 'red').save(buffer, 'PNG')
+        cls.image = ('data:image/png;base64,'
+                     + b64encode(buffer.getvalue()).decode())
+
+    def setUp(self):
+        get_cache().clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def send(self, user, method, path, data=None):
+        self.client.force_authenticate(user)
+        response = getattr(self.client, method)(path, data, format='json')
+        self.assertLess(response.status_code, 300, response.content)
+        return response
+
+    def assert_in_step(self, **expected):
+        for model, field, related_model, related_field in COUNTERS:
+            for pk, stored in model.objects.values_list('pk', field):
+                with self.subTest(model=model.__name__, field=field, pk=pk):
+                    self.assertEqual(stored, related_model.objects.filter(
+                        **{related_field: pk}).count())
+        self.author.refresh_from_db()
+        self.assertEqual(
+            {field: getattr(self.author, field) for field in expected},
+            expected)
+
+    def create_recipe(self, name):
+        return self.send(self.author, 'post', '/api/recipes/', {
+            'name': name, 'text': 'Описание', 'cooking_time': 10,
+            'image': self.image, 'tags': [self.tag.pk],
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 10}],
+        }).data['id']
+
+    def import_recipes(self, count):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl',
+                                         encoding='utf-8') as file:
+            for number in range(count):
+                file.write(json.dumps({
+                    'author': self.author.email, 'name': f'Суп {number}',
+                    'text': 'Описание', 'cooking_time': 10, 'tags': ['tag'],
+                    'ingredients': [{'name': 'Морковь',
+                                     'measurement_unit': 'г',
+                                     'amount': 10}],
+                }, ensure_ascii=False) + '\n')
+            file.flush()
+            call_command('import_data', file.name, model='recipes',
+                         batch_size=2, stdout=StringIO())
+        run_pending_ids()
+
+    def test_counters_follow_changes(self):
+        self.send(self.reader, 'post',
+                  f'/api/users/{self.author.pk}/subscribe/')
+        self.assert_in_step(followers_count=1, recipes_count=0)
+        first, second = (self.create_recipe(name)
+                         for name in ('Борщ', 'Щи'))
+        self.assert_in_step(recipes_count=2)
+        for user, recipe in ((self.reader, first), (self.reader, second),
+                             (self.author, first)):
+            self.send(user, 'post', f'/api/recipes/{recipe}/favorite/')
+        self.assertEqual(Recipe.objects.get(pk=first).favorites_count, 2)
+        self.send(self.author, 'delete', f'/api/recipes/{first}/favorite/')
+        self.send(self.author, 'delete', f'/api/recipes/{second}/')
+        self.assert_in_step(recipes_count=1)
+        self.assertEqual(Recipe.objects.get(pk=first).favorites_count, 1)
+        self.import_recipes(3)
+        self.assert_in_step(recipes_count=4)
+        self.send(self.reader, 'delete',
+                  f'/api/users/{self.author.pk}/subscribe/')
+        self.assert_in_step(followers_count=0, recipes_count=4)
+
+
+class ImportSubscriptionsTests(APITestCase):
+    """Импорт подписок: без дубликатов и подписок на себя, со счётчиками
+    и лентами."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.first, self.second, self.author = (
+            User.objects.create_user(username=name,
+                                     email=f'{name}@example.com',
+                                     password='pass')
+            for name in ('first', 'second', 'author'))
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', author=self.author,
+            image='static/recipe/test.png', cooking_time=10)
+
+    def import_file(self, suffix, content, **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix,
+                                         encoding='utf-8') as file:
+            file.write(content)
+            file.flush()
+            out = StringIO()
+            call_command('import_subscriptions', file.name, batch_size=2,
+                         stdout=out, **options)
+        run_pending_ids()
+        return out.getvalue()
+
+    def get_pairs(self):
+        return set(Subscribe.objects.values_list('user__username',
+                                                 'author__username'))
+
+    def test_csv_twice(self):
+        content = ('user,author\n'
+                   'first@example.com,author@example.com\n'
+                   'second@example.com,author@example.com\n'
+                   'first@example.com,author@example.com\n'
+                   'author@example.com,author@example.com\n'
+                   'first@example.com,missing@example.com\n'
+                   'second@example.com,first@example.com\n')
+        self.assertIn('создано подписок: 3', self.import_file('.csv', content))
+        self.assertIn('создано подписок: 0', self.import_file('.csv', content))
+        self.assertEqual(self.get_pairs(), {('first', 'author'),
+                                            ('second', 'author'),
+                                            ('second', 'first')})
+        self.author.refresh_from_db()
+        self.first.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 2)
+        self.assertEqual(self.first.followers_count, 1)
+        self.assertEqual(
+            set(FeedItem.objects.filter(recipe=self.recipe).values_list(
+                'user', flat=True)),
+            {self.first.pk, self.second.pk})
+
+    def test_json_by_username(self):
+        self.import_file('.json', json.dumps(
+            [{'user': 'first', 'author': 'second'}]), key='username')
+        self.assertEqual(self.get_pairs(), {('first', 'second')})
+
+    def test_bad_id(self):
+        with self.assertRaises(CommandError):
+            self.import_file('.csv', 'first,author\n', key='id')
+        self.assertFalse(Subscribe.objects.exists())
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """orjson выдаёт тот же JSON, что и стандартный рендерер."""
+
+    DATA = {
+        'name': 'Борщ "домашний"',
+        'amount': Decimal('12.50'),
+        'pub_date': datetime(2024, 5, 1, 12, 30, 15, 123456,
+                             tzinfo=timezone.utc),
+        'day': date(2024, 5, 1),
+        'uuid': UUID('12345678-1234-5678-1234-567812345678'),
+        'tags': [{'id': 1, 'slug': 'soup'}],
+        'empty': None,
+    }
+
+    def test_same_as_json_renderer(self):
+        self.assertEqual(json.loads(FastJSONRenderer().render(self.DATA)),
+                         json.loads(JSONRenderer().render(self.DATA)))
+
+    def test_without_orjson(self):
+        with mock.patch('api.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.DATA),
+                             JSONRenderer().render(self.DATA))
+
+
+@override_settings(RESPONSE_COMPRESSION_MIN_SIZE=200)
+class CompressionTests(APITestCase):
+    """Сжатие ответов от RESPONSE_COMPRESSION_MIN_SIZE байт."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(10):
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}',
+                               color=f'#00000{number}')
+
+    def setUp(self):
+        get_cache().clear()
+
+    def get(self, encoding, path='/api/tags/', **headers):
+        return self.client.get(path, HTTP_ACCEPT_ENCODING=encoding,
+                               **headers)
+
+    def test_gzip(self):
+        plain = self.get('')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        response = self.get('gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(int(response['Content-Length']),
+                         len(response.content))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=10**6)
+    def test_small_response_not_compressed(self):
+        self.assertNotIn('Content-Encoding', self.get('gzip'))
+
+    @skipUnless(brotli, 'brotli не установлен')
+    def test_brotli(self):
+        plain = self.get('')
+        response = self.get('gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+    def test_streaming(self):
+        user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        self.client.force_authenticate(user)
+        response = self.get(
+            'gzip', '/api/recipes/download_shopping_cart/?format=txt')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)).decode(),
+            'Список покупок пуст\n')
+
+    def test_weak_etag(self):
+        etag = self.get('')['ETag']
+        response = self.get('gzip')
+        self.assertEqual(response['ETag'], 'W/' + etag)
+        response = self.get('gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Проверка на соединении SQLite')
+class HealthChecksTests(SimpleTestCase):
+    """Соединение проверяется один раз, при первом обращении к базе."""
+
+    def setUp(self):
+        default = connections[DEFAULT_DB_ALIAS]
+
+        class DatabaseWrapper(HealthChecksMixin, type(default)):
+            pass
+
+        # Соединение с базой в памяти SQLite никогда не закрывает.
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.wrapper = DatabaseWrapper(dict(
+            default.settings_dict, NAME=f'{directory.name}/health.sqlite3',
+            CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True))
+        self.wrapper.ensure_connection()
+        self.addCleanup(self.wrapper.close)
+
+    def test_broken_connection_replaced(self):
+        broken = self.wrapper.connection
+        self.wrapper.close_if_unusable_or_obsolete()
+        with mock.patch.object(self.wrapper, 'is_usable',
+                               return_value=False) as is_usable:
+            self.wrapper.ensure_connection()
+            self.wrapper.ensure_connection()
+        self.assertEqual(is_usable.call_count, 1)
+        self.assertIsNot(self.wrapper.connection, broken)
+
+    def test_no_check_without_queries(self):
+        with mock.patch.object(self.wrapper, 'is_usable') as is_usable:
+            self.wrapper.close_if_unusable_or_obsolete()
+        is_usable.assert_not_called()
+
+
+class ConcurrentUserRecipesTests(TransactionTestCase):
+    """Одновременные добавления одного рецепта: одна запись, без 500."""
+
+    THREADS = 8
+    REPEATS = 5
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', author=self.user,
+            image='static/recipe/test.png', cooking_time=10)
+        self.ingredient = Ingredient.objects.create(name='Морковь',
+                                                    measurement_unit='г')
+        IngredientInRecipe.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=100)
+
+    def hammer(self, method, path):
+        barrier = threading.Barrier(self.THREADS)
+
+        def send():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                return [getattr(client, method)(path).status_code
+                        for _ in range(self.REPEATS)]
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.THREADS) as executor:
+            futures = [executor.submit(send) for _ in range(self.THREADS)]
+        return Counter(code for future in futures
+                       for code in future.result())
+
+    def assert_single_success(self, codes, success):
+        self.assertEqual(codes, Counter({
+            success: 1, 400: self.THREADS * self.REPEATS - 1}))
+
+    def test_favorite(self):
+        path = f'/api/recipes/{self.recipe.pk}/favorite/'
+        self.assert_single_success(self.hammer('post', path), 201)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assert_single_success(self.hammer('delete', path), 204)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertFalse(FavoriteRecipe.objects.exists())
+
+    def test_missing_recipe(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        missing = self.recipe.pk + 1
+        for path in (f'/api/recipes/{missing}/favorite/',
+                     f'/api/recipes/{missing}/shopping_cart/'):
+            with self.subTest(path=path):
+                self.assertEqual(client.post(path).status_code, 404)
+
+    def test_shopping_cart(self):
+        path = f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        self.assert_single_success(self.hammer('post', path), 201)
+        self.assertEqual(ShoppingCart.objects.count(), 1)
+        self.assertEqual(list(ShoppingCartIngredient.objects.values_list(
+            'ingredient', 'amount')), [(self.ingredient.pk, 100)])
+        self.assert_single_success(self.hammer('delete', path), 204)
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.assertFalse(ShoppingCartIngredient.objects.filter(
+            amount__gt=0).exists())
+
+
+class SparseFieldsTests(APITestCase):
+    """?fields= и ?omit= для тегов и ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Тег', slug='tag', color='#000000')
+        Ingredient.objects.create(name='Морковь', measurement_unit='г')
+
+    def setUp(self):
+        get_cache().clear()
+
+    def get_keys(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [set(item) for item in response.data]
+
+    def test_tags(self):
+        self.assertEqual(self.get_keys('/api/tags/?fields=slug'),
+                         [{'id', 'slug'}])
+        self.assertEqual(self.get_keys('/api/tags/?omit=color,name'),
+                         [{'id', 'slug'}])
+
+    def test_ingredients(self):
+        self.assertEqual(
+            self.get_keys('/api/ingredients/?name=мор&fields=name'),
+            [{'id', 'name'}])
+        self.assertEqual(
+            self.get_keys('/api/ingredients/?omit=measurement_unit'),
+            [{'id', 'name'}])
+        self.assertEqual(self.get_keys('/api/ingredients/'),
+                         [{'id', 'name', 'measurement_unit'}])
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTests(APITestCase):
+    """Кеш ответов: попадания, сброс по версиям групп, ETag и 304."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        Tag.objects.create(name='Тег', slug='tag', color='#000000')
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', author=cls.author,
+            image='static/recipe/test.png', cooking_time=10)
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_hit_without_queries(self):
+        first = self.client.get('/api/tags/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/tags/')
+        self.assertEqual(second.content, first.content)
+
+    def test_invalidated_by_change(self):
+        path = f'/api/recipes/{self.recipe.pk}/'
+        self.assertEqual(self.client.get(path).data['name'], 'Рецепт')
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(path, {'name': 'Суп'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(path).data['name'], 'Суп')
+
+    def test_etag(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Tag.objects.create(name='Новый', slug='new', color='#ffffff')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data), 2)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=None)
+    def test_off_for_process_local_backend(self):
+        self.assertFalse(is_enabled())
+        self.client.get('/api/tags/')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/tags/')
+        self.assertTrue(queries)
+
+
+class OverlayTests(APITestCase):
+    """Персональные флаги поверх общего тела ответа не устаревают."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = (
+            User.objects.create_user(username=name,
+                                     email=f'{name}@example.com',
+                                     password='pass')
+            for name in ('author', 'reader'))
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', author=cls.author,
+            image='static/recipe/test.png', cooking_time=10)
+
+    def setUp(self):
+        get_cache().clear()
+        self.client.force_authenticate(self.reader)
+
+    def get_flags(self):
+        recipe, = self.client.get(
+            '/api/recipes/?page=1&limit=6').data['results']
+        return (recipe['is_favorited'], recipe['is_in_shopping_cart'],
+                recipe['author']['is_subscribed'])
+
+    def change(self, method):
+        for path in (f'/api/recipes/{self.recipe.pk}/favorite/',
+                     f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+                     f'/api/users/{self.author.pk}/subscribe/'):
+            response = getattr(self.client, method)(path)
+            self.assertLess(response.status_code, 300, response.content)
+
+    def assert_flags_follow_changes(self):
+        self.assertEqual(self.get_flags(), (False, False, False))
+        self.change('post')
+        self.assertEqual(self.get_flags(), (True, True, True))
+        self.change('delete')
+        self.assertEqual(self.get_flags(), (False, False, False))
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_cached_sets_invalidated(self):
+        self.assert_flags_follow_changes()
+
+    def test_sets_loaded_per_request_without_shared_cache(self):
+        self.assert_flags_follow_changes()
+        with self.assertNumQueries(3):
+            get_user_sets(self.reader)
+        with self.assertNumQueries(3):
+            get_user_sets(self.reader)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Копия базы через backup SQLite')
+@override_settings(DATABASE_REPLICAS=['replica_test'])
+class ReplicaReadTests(TransactionTestCase):
+    """Чтения идут в реплику, а после изменения — в default на любом
+    воркере."""
+
+    REPLICA = 'replica_test'
+
+    def setUp(self):
+        self.author, self.reader = (
+            User.objects.create_user(username=name,
+                                     email=f'{name}@example.com',
+                                     password='pass')
+            for name in ('author', 'reader'))
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', author=self.author,
+            image='static/recipe/test.png', cooking_time=10)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'replica.sqlite3')
+        connection.ensure_connection()
+        with sqlite3.connect(path) as replica:
+            connection.connection.backup(replica)
+        replica.close()
+        connections.databases[self.REPLICA] = dict(
+            connections.databases[DEFAULT_DB_ALIAS], NAME=path)
+        self.addCleanup(self.remove_replica)
+        # Реплика отстаёт: нового названия в ней ещё нет.
+        Recipe.objects.filter(pk=self.recipe.pk).update(name='Новое')
+
+    def remove_replica(self):
+        connections[self.REPLICA].close()
+        del connections.databases[self.REPLICA]
+        if hasattr(connections._connections, self.REPLICA):
+            delattr(connections._connections, self.REPLICA)
+
+    def get_name(self, client):
+        return client.get(f'/api/recipes/{self.recipe.pk}/').data['name']
+
+    def test_reads_primary_after_write(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        self.assertEqual(self.get_name(client), 'Рецепт')
+        response = client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        # Следующий запрос может попасть на другой воркер с пустым кешем.
+        get_cache().clear()
+        self.assertEqual(self.get_name(client), 'Новое')
+
+    def test_cookie_of_other_user_ignored(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        client.force_authenticate(self.author)
+        self.assertEqual(self.get_name(client), 'Рецепт')
+
+
+class MetricsTests(APITestCase):
+    """/metrics и учёт SQL-запросов в MetricsMiddleware."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Тег', slug='tag', color='#000000')
+
+    def get_count(self, view):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        sample = (f'foodgram_request_duration_seconds_count'
+                  f'{{worker="{os.getpid()}",view="{view}"}} ')
+        for line in response.content.decode().splitlines():
+            if line.startswith(sample):
+                return int(line[len(sample):])
+        return 0
+
+    def test_metrics_output(self):
+        before = self.get_count('TagViewSet.list')
+        self.client.get('/api/tags/')
+        self.client.get('/api/tags/')
+        self.assertEqual(self.get_count('TagViewSet.list'), before + 2)
+        content = self.client.get('/metrics').content.decode()
+        for name in ('foodgram_request_queries_bucket',
+                     'foodgram_request_db_seconds_total',
+                     'foodgram_response_bytes_total',
+                     'foodgram_response_cache_hits_total'):
+            with self.subTest(name=name):
+                self.assertIn(name, content)
+
+    def test_queries_counted(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tags/')
+        self.assertTrue(queries)
+        self.assertIn(f'desc="{len(queries)} queries"',
+                      response['Server-Timing'])
+
+    @override_settings(METRICS_QUERY_BUDGET=0)
+    def test_query_budget_warning(self):
+        with self.assertLogs('api.metrics', 'WARNING') as logs:
+            self.client.get('/api/tags/')
+        self.assertIn('TagViewSet.list', logs.output[0])
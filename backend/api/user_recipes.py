@@ -0,0 +1,68 @@
+from django.db import connection, transaction
+from django.db.models import F
+
+from . import cache, cart_totals
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
+
+RECIPE_TABLE = Recipe._meta.db_table
+
+
+def add(model, user_id, recipe_ids):
+    """Добавляет рецепты в избранное или корзину одним запросом.
+
+    Уже добавленные и несуществующие рецепты пропускаются по ограничению
+    уникальности, без предварительной проверки, поэтому одновременные
+    запросы не падают с IntegrityError. Возвращает id добавленных рецептов.
+    Сигналы при этом не отправляются, счётчики, итоги корзины и кеш
+    обновляются здесь же.
+    """
+    if not recipe_ids:
+        return []
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {model._meta.db_table} (user_id, recipe_id) '
+            f'SELECT %s, id FROM {RECIPE_TABLE} '
+            f'WHERE id IN ({placeholders}) '
+            f'ON CONFLICT (user_id, recipe_id) DO NOTHING '
+            f'RETURNING recipe_id',
+            [user_id, *recipe_ids])
+        added = [recipe_id for recipe_id, in cursor.fetchall()]
+        if added:
+            changed(model, user_id, added, 1)
+    return added
+
+
+def remove(model, user_id, recipe_ids=None):
+    """Убирает рецепты из избранного или корзины, без recipe_ids —
+    все. Возвращает id убранных рецептов.
+    """
+    if recipe_ids is not None and not recipe_ids:
+        return []
+    recipe_filter = ''
+    if recipe_ids is not None:
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        recipe_filter = f' AND recipe_id IN ({placeholders})'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {model._meta.db_table} '
+            f'WHERE user_id = %s{recipe_filter} RETURNING recipe_id',
+            [user_id, *(recipe_ids or ())])
+        removed = [recipe_id for recipe_id, in cursor.fetchall()]
+        if removed:
+            changed(model, user_id, removed, -1)
+    return removed
+
+
+def changed(model, user_id, recipe_ids, delta):
+    if model is FavoriteRecipe:
+        recipes = Recipe.objects.filter(pk__in=recipe_ids)
+        if delta < 0:
+            recipes = recipes.filter(favorites_count__gte=-delta)
+        recipes.update(favorites_count=F('favorites_count') + delta)
+    elif model is ShoppingCart:
+        if delta > 0:
+            cart_totals.add_recipes(recipe_ids, user_id)
+        else:
+            cart_totals.remove_recipes(recipe_ids, user_id)
+    cache.invalidate(f'user:{user_id}')
@@ -1,5 +1,6 @@
-from django.db.models import F, Sum
-from django.http import HttpResponse
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Value
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
@@ -9,42 +10,130 @@ from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import (SAFE_METHODS, AllowAny,
                                         IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from .filters import IngredientFilter, RecipeFilter
-from .pagination import MyPagination
+from . import subscriptions, user_recipes
+from .cache import SharedResponseCacheMixin
+from .cart_totals import get_summary
+from .feed import get_feed_page
+from .filters import RecipeFilter, RecipeOrderingFilter
+from .ingredient_index import ingredient_index
+from .overlay import overlay_recipes
+from .pagination import KeysetPagination, MyPagination
 from .permissions import IsAuthorOrReadOnly
-from .serializers import (EditRecipeSerializer, IngredientsSerializer,
+from .recipe_index import recipe_index
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from .replicas import ReplicaReadMixin
+from .serializers import (AuthorIdsSerializer, EditRecipeSerializer,
+                          IngredientsSerializer, RecipeIdsSerializer,
                           RecipeSerializer,
                           ShoppingCartAndFavoriteRecipeSerializer,
                           SubscribeSerializer, TagSerializer, UsersSerializer)
+from .shopping_list import STREAMS, get_ingredients, get_pdf_font, render_pdf
+from .sparse_fields import get_field_filter, is_requested
 from recipes.models import (FavoriteRecipe, Ingredient, IngredientInRecipe,
                             Recipe, ShoppingCart, Subscribe, Tag, User)
 
+BY_INGREDIENTS_LIMIT = 100
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(ReplicaReadMixin, SharedResponseCacheMixin,
+                 viewsets.ReadOnlyModelViewSet):
+    cache_groups = {'list': ('tags',), 'retrieve': ('tags',)}
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context.update({"field_filter": get_field_filter(self.request)})
+        return context
+
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientsViewSet(ReplicaReadMixin, SharedResponseCacheMixin,
+                         viewsets.ReadOnlyModelViewSet):
+    # Список отдаётся из ingredient_index без запросов к базе, поэтому
+    # кешируется только retrieve.
+    cache_groups = {'retrieve': ('ingredients',)}
     queryset = Ingredient.objects.all()
     serializer_class = IngredientsSerializer
     permission_classes = (AllowAny,)
-    filter_backends = (IngredientFilter,)
-    search_fields = ('^name',)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            if not limit.isdigit():
+                return Response('limit должен быть целым числом',
+                                status=status.HTTP_400_BAD_REQUEST)
+            limit = int(limit)
+        serializer = self.get_serializer(ingredient_index.search(
+            request.query_params.get('name', ''), limit), many=True)
+        return Response(serializer.data)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context.update({"field_filter": get_field_filter(self.request)})
+        return context
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, SharedResponseCacheMixin,
+                    viewsets.ModelViewSet):
+    cache_groups = {
+        'list': ('recipes', 'recipe-list'),
+        'retrieve': ('recipes', 'recipe:{pk}'),
+    }
+    user_scoped_params = ('is_favorited', 'is_in_shopping_cart')
     queryset = Recipe.objects.all()
-    filter_backends = (DjangoFilterBackend,)
+    lookup_value_regex = r'\d+'
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     permission_classes = (IsAuthorOrReadOnly,)
     filterset_class = RecipeFilter
+    ordering_fields = ('pub_date', 'favorites_count')
     pagination_class = MyPagination
 
+    def get_queryset(self):
+        request = self.request
+        queryset = Recipe.objects.all()
+        if request.method in SAFE_METHODS:
+            queryset = queryset.defer('search_text', 'search_vector')
+        if not is_requested(request, 'text'):
+            queryset = queryset.defer('text')
+        if is_requested(request, 'author'):
+            queryset = queryset.select_related('author')
+        if is_requested(request, 'tags'):
+            queryset = queryset.prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.all()))
+        if is_requested(request, 'ingredients'):
+            queryset = queryset.prefetch_related(
+                Prefetch('ingredient_list',
+                         queryset=IngredientInRecipe.objects.select_related(
+                             'ingredient')))
+        user = request.user
+        if user.is_anonymous or self.shared_body:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+                author_is_subscribed=Value(False,
+                                           output_field=BooleanField()),
+            )
+        flags = {}
+        if is_requested(request, 'is_favorited'):
+            flags['is_favorited'] = Exists(FavoriteRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+        if is_requested(request, 'is_in_shopping_cart'):
+            flags['is_in_shopping_cart'] = Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+        if is_requested(request, 'author'):
+            flags['author_is_subscribed'] = Exists(Subscribe.objects.filter(
+                user=user, author=OuterRef('author')))
+        return queryset.annotate(**flags)
+
+    def personalize(self, data, user):
+        return overlay_recipes(data, user)
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSerializer
@@ -52,9 +141,65 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        context.update({"request": self.request})
+        context.update({"request": self.request,
+                        "field_filter": get_field_filter(self.request)})
         return context
 
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(IsAuthenticated,),
+        url_path='feed',
+        url_name='feed',
+    )
+    def feed(self, request):
+        paginator = KeysetPagination()
+        paginator.request = request
+        recipes, paginator.next_position = get_feed_page(
+            request.user, self.get_queryset(),
+            paginator.get_position(request), paginator.get_page_size(request))
+        serializer = RecipeSerializer(recipes, many=True,
+                                      context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(AllowAny,),
+        url_path='by_ingredients',
+        url_name='by_ingredients',
+    )
+    def by_ingredients(self, request):
+        try:
+            ingredient_ids = [
+                int(value)
+                for values in request.query_params.getlist('ingredients')
+                for value in values.split(',') if value
+            ]
+            min_coverage = int(request.query_params.get('min_coverage', 100))
+        except ValueError:
+            return Response('Ингредиенты и min_coverage задаются числами',
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not ingredient_ids or not 1 <= min_coverage <= 100:
+            return Response('Укажите ингредиенты и min_coverage от 1 до 100',
+                            status=status.HTTP_400_BAD_REQUEST)
+        if KeysetPagination.cursor_query_param in request.query_params:
+            return Response('Рецепты упорядочены по найденным ингредиентам, '
+                            'используйте page и limit вместо cursor',
+                            status=status.HTTP_400_BAD_REQUEST)
+        recipe_ids = recipe_index.search(ingredient_ids, min_coverage)
+        page = self.paginate_queryset(recipe_ids)
+        paginated = page is not None
+        if not paginated:
+            page = recipe_ids[:BY_INGREDIENTS_LIMIT]
+        recipes = self.get_queryset().in_bulk(page)
+        serializer = RecipeSerializer(
+            [recipes[pk] for pk in page if pk in recipes],
+            many=True, context=self.get_serializer_context())
+        if paginated:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
     @action(
         detail=True,
         methods=('post', 'delete'),
@@ -63,62 +208,74 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_name='shopping_cart',
     )
     def shopping_cart(self, request, pk):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-
         if request.method == 'POST':
-            if ShoppingCart.objects.filter(user=user, recipe_id=pk).exists():
-                return Response("Уже в корзине",
-                                status=status.HTTP_400_BAD_REQUEST
-                                )
-            ShoppingCart.objects.create(user=user, recipe_id=pk)
-            serializer = ShoppingCartAndFavoriteRecipeSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return self.add_recipe(ShoppingCart, pk, 'Уже в корзине')
+        return self.remove_recipe(ShoppingCart, pk, 'Рецепта нет в корзине')
 
-        if request.method == 'DELETE':
-            obj = ShoppingCart.objects.filter(user=user, recipe__id=pk)
-            if obj.exists():
-                obj.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            return Response('Рецепта нет в корзине',
-                            status=status.HTTP_400_BAD_REQUEST)
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart',
+        url_name='shopping_cart_bulk',
+    )
+    def shopping_cart_bulk(self, request):
+        return self.change_recipes(request, ShoppingCart)
 
-    @staticmethod
-    def get_txt(ingredients):
-        if not ingredients:
-            return 'Список покупок пуст'
-        shops = 'Список покупок:\n'
-        for ingredient in ingredients:
-            shops += (
-                f"{ingredient['ingredient__name']}  - "
-                f"{ingredient['sum']} "
-                f"({ingredient['ingredient__measurement_unit']})\n"
-            )
-        return shops
+    @action(
+        detail=False,
+        methods=('delete',),
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart/clear',
+        url_name='shopping_cart_clear',
+    )
+    def shopping_cart_clear(self, request):
+        user_recipes.remove(ShoppingCart, request.user.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart/summary',
+        url_name='shopping_cart_summary',
+    )
+    def shopping_cart_summary(self, request):
+        return Response({
+            'recipes_count': ShoppingCart.objects.filter(
+                user=request.user).count(),
+            'ingredients': list(get_summary(request.user)),
+        })
 
     @action(
         detail=False,
         methods=('get',),
         permission_classes=(IsAuthenticated,),
+        renderer_classes=(PlainTextRenderer, JSONRenderer, CSVRenderer,
+                          PDFRenderer),
         url_path='download_shopping_cart',
         url_name='download_shopping_cart',
     )
     def download_shopping_cart(self, request):
-        shopping_cart_recipes = (ShoppingCart.objects.
-                                 filter(user=request.user).
-                                 values_list('recipe', flat=True))
-
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__in=shopping_cart_recipes).values(
-            name=F('ingredient__name'),
-            unit=F('ingredient__measurement_unit')).annotate(
-            amount_sum=Sum('amount'))
-
-        shopping_list = 'Список покупок:\n' + '\n'.join(
-            [f'{ingredient["name"]} -  '
-             f'{ingredient["amount_sum"]}'
-             f' {ingredient["unit"]} \n' for ingredient in ingredients])
-        return HttpResponse(shopping_list, content_type='text/plain')
+        export_format = request.accepted_renderer.format
+        ingredients = get_ingredients(request.user)
+        if export_format == 'pdf':
+            try:
+                font = get_pdf_font()
+            except ImproperlyConfigured as error:
+                return HttpResponse(
+                    f'Выгрузка в PDF недоступна: {error}',
+                    content_type='text/plain; charset=utf-8',
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response = HttpResponse(render_pdf(ingredients, font),
+                                    content_type='application/pdf')
+        else:
+            stream, content_type = STREAMS[export_format]
+            response = StreamingHttpResponse(stream(ingredients),
+                                             content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{export_format}"')
+        return response
 
     @action(
         detail=True,
@@ -128,35 +285,61 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_name='favorite',
     )
     def favorite_recipe(self, request, pk):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
         if request.method == 'POST':
-            if FavoriteRecipe.objects.filter(user=user,
-                                             recipe_id=pk).exists():
-                return Response('Этот рецепт уже в избранном',
-                                status=status.HTTP_400_BAD_REQUEST)
-            FavoriteRecipe.objects.create(user=user, recipe_id=pk)
-            serializer = ShoppingCartAndFavoriteRecipeSerializer(recipe)
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
+            return self.add_recipe(FavoriteRecipe, pk,
+                                   'Этот рецепт уже в избранном')
+        return self.remove_recipe(FavoriteRecipe, pk,
+                                  'Этого рецепта нет в избранном')
+
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        url_path='favorite',
+        url_name='favorite_bulk',
+    )
+    def favorite_bulk(self, request):
+        return self.change_recipes(request, FavoriteRecipe)
+
+    def add_recipe(self, model, pk, error):
+        # Сначала вставка: существование рецепта и повтор проверяет сама
+        # база, рецепт ищется, только если строка не добавилась.
+        if not user_recipes.add(model, self.request.user.pk, [int(pk)]):
+            get_object_or_404(Recipe, id=pk)
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ShoppingCartAndFavoriteRecipeSerializer(
+            Recipe.objects.get(pk=pk))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def remove_recipe(self, model, pk, error):
+        if not user_recipes.remove(model, self.request.user.pk, [int(pk)]):
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def change_recipes(self, request, model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
         if request.method == 'DELETE':
-            obj = FavoriteRecipe.objects.filter(user=user, recipe_id=pk)
-            if obj.exists():
-                obj.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            return Response('Этого рецепта нет в избранном',
-                            status=status.HTTP_400_BAD_REQUEST)
+            user_recipes.remove(model, request.user.pk, recipe_ids)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        added = user_recipes.add(model, request.user.pk, recipe_ids)
+        serializer = ShoppingCartAndFavoriteRecipeSerializer(
+            Recipe.objects.filter(pk__in=added), many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class UsersViewSet(UserViewSet):
+class UsersViewSet(ReplicaReadMixin, UserViewSet):
     queryset = User.objects.all()
     serializer_class = UsersSerializer
+    lookup_value_regex = r'\d+'
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = LimitOffsetPagination
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        context.update({"request": self.request})
+        context.update({"request": self.request,
+                        "field_filter": get_field_filter(self.request)})
         return context
 
     @action(
@@ -167,15 +350,33 @@ class UsersViewSet(UserViewSet):
         url_name='subscriptions',
     )
     def get_subs(self, request):
-        user = request.user
-        subscribers = User.objects.filter(subscribe__user=user.id)
-        if not subscribers:
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit is not None:
+            if not recipes_limit.isdigit():
+                return Response('recipes_limit должен быть целым числом',
+                                status=status.HTTP_400_BAD_REQUEST)
+            recipes_limit = int(recipes_limit)
+        authors = User.objects.filter(subscribe__user=request.user).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by('id')
+        page = self.paginate_queryset(authors)
+        paginated = page is not None
+        if not paginated:
+            page = list(authors)
+        if not (self.paginator.count if paginated else page):
             return Response('У вас нет подписок!',
                             status=status.HTTP_400_BAD_REQUEST)
-        pages = self.paginate_queryset(subscribers)
-        serializer = SubscribeSerializer(pages, many=True,
-                                         context={'request': request})
-        return self.get_paginated_response(serializer.data)
+        recipes = subscriptions.get_latest_recipes(
+            [author.pk for author in page], recipes_limit)
+        for author in page:
+            author.latest_recipes = recipes[author.pk]
+        serializer = SubscribeSerializer(
+            page, many=True,
+            context={'request': request,
+                     'field_filter': get_field_filter(request)})
+        if paginated:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
 
     @action(
         detail=True,
@@ -186,26 +387,36 @@ class UsersViewSet(UserViewSet):
     )
     def subscribe(self, request, id):
         user = request.user
-        author = get_object_or_404(User, id=id)
-        sub = Subscribe.objects.filter(user=user.id, author=author)
-
         if request.method == 'POST':
-            if user == author:
+            if user.pk == int(id):
                 return Response('Нельзя быть подписанным на самого себя',
                                 status=status.HTTP_400_BAD_REQUEST)
-            if sub.exists():
-                return Response('Вы уже подписаны',
-                                status=status.HTTP_400_BAD_REQUEST)
-            subscribe = Subscribe.objects.create(
-                user=user,
-                author=author
-            )
-            subscribe.save()
-            return Response('Вы подписались на этого автора',
-                            status=status.HTTP_201_CREATED)
-        if sub.exists():
-            sub.delete()
-            return Response(f'Вы отписались от {author}',
-                            status=status.HTTP_204_NO_CONTENT)
+            if subscriptions.follow(user.pk, [int(id)]):
+                return Response('Вы подписались на этого автора',
+                                status=status.HTTP_201_CREATED)
+            get_object_or_404(User, id=id)
+            return Response('Вы уже подписаны',
+                            status=status.HTTP_400_BAD_REQUEST)
+        if subscriptions.unfollow(user.pk, [int(id)]):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        author = get_object_or_404(User, id=id)
         return Response(f'Вы не подписаны на {author}',
                         status=status.HTTP_400_BAD_REQUEST)
+
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        url_path='subscribe',
+        url_name='subscribe_many',
+    )
+    def subscribe_many(self, request):
+        serializer = AuthorIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        author_ids = serializer.validated_data['authors']
+        if request.method == 'DELETE':
+            subscriptions.unfollow(request.user.pk, author_ids)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(
+            {'authors': subscriptions.follow(request.user.pk, author_ids)},
+            status=status.HTTP_201_CREATED)
@@ -0,0 +1,7 @@
+from django.db.backends.postgresql import base
+
+from .health_checks import HealthChecksMixin
+
+
+class DatabaseWrapper(HealthChecksMixin, base.DatabaseWrapper):
+    """PostgreSQL с проверкой постоянных соединений (DB_CONN_HEALTH_CHECKS)."""
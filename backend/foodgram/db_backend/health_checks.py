@@ -0,0 +1,24 @@
+class HealthChecksMixin:
+    """Проверка постоянного соединения при первом обращении к базе в
+    запросе, как CONN_HEALTH_CHECKS в Django 4.1.
+
+    Соединение, оборванное сервером или пулом, закрывается, и запрос
+    открывает новое вместо ошибки. Запросы без обращения к базе проверку
+    не выполняют.
+    """
+
+    health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if not self.health_check_done:
+            self.health_check_done = True
+            if (self.connection is not None
+                    and self.settings_dict.get('CONN_HEALTH_CHECKS')
+                    and not self.in_atomic_block
+                    and not self.is_usable()):
+                self.close()
+        super().ensure_connection()
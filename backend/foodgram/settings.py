@@ -1,4 +1,5 @@
 import os
+from itertools import zip_longest
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,9 +40,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -76,9 +80,55 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        # Сколько секунд держать соединение открытым между запросами,
+        # 0 — открывать новое соединение на каждый запрос
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+        # Проверять постоянное соединение при первом обращении к базе в
+        # запросе и открывать новое, если старое закрыто сервером
+        # (см. foodgram.db_backend)
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', '1') == '1',
+        # Для pgbouncer в режиме transaction pooling: серверные курсоры
+        # .iterator() не переживают смену соединения между транзакциями
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DB_DISABLE_SERVER_SIDE_CURSORS', '0') == '1',
     }
 }
+if 'postgresql' in (DATABASES['default']['ENGINE'] or ''):
+    DATABASES['default']['ENGINE'] = 'foodgram.db_backend'
+    DATABASES['default']['OPTIONS'] = {
+        'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+        'keepalives': 1,
+        'keepalives_idle': int(os.getenv('DB_KEEPALIVES_IDLE', 60)),
+    }
+
+if 'sqlite3' in (DATABASES['default']['ENGINE'] or ''):
+    # Тестовая база SQLite в файле: в памяти соединения из разных потоков
+    # блокируют таблицы целиком, а close() соединение не закрывает
+    DATABASES['default']['TEST'] = {
+        'NAME': os.getenv('DB_TEST_NAME', str(BASE_DIR / 'test_db.sqlite3'))}
+
+# Реплики только для чтения: хосты через запятую, остальные параметры
+# как у default. DB_REPLICA_NAMES задаёт имена баз (например, копии
+# файлов SQLite для локальной проверки)
+DB_REPLICA_HOSTS = [
+    host for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host]
+DB_REPLICA_NAMES = [
+    name for name in os.getenv('DB_REPLICA_NAMES', '').split(',') if name]
+DATABASE_REPLICAS = []
+for number, (host, name) in enumerate(
+        zip_longest(DB_REPLICA_HOSTS, DB_REPLICA_NAMES)):
+    DATABASES[f'replica_{number}'] = dict(
+        DATABASES['default'],
+        HOST=host or DATABASES['default']['HOST'],
+        NAME=name or DATABASES['default']['NAME'],
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(f'replica_{number}')
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+# Сколько секунд после изменения данных пользователь читает из default
+REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', 5))
+
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.sqlite3',
@@ -116,6 +166,11 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.SearchFilter',
     ],
+    # orjson, если установлен; без него — стандартный JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 
 }
 
@@ -158,3 +213,54 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CSV_FILES_DIR = os.path.join(BASE_DIR, 'data')
+
+# TTF-шрифт с кириллицей для PDF-выгрузки списка покупок (пакет
+# fonts-dejavu-core в образе); без него manage.py check падает с ошибкой
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+# Время жизни префиксного индекса ингредиентов в памяти процесса, секунды
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+
+# Авторы с большим числом подписчиков не раскладываются по лентам при
+# публикации рецепта, их рецепты подмешиваются в ленту при чтении
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+
+# Сколько секунд хранить в кеше число рецептов для набора фильтров,
+# 0 — считать COUNT(*) на каждый запрос
+RECIPE_COUNT_CACHE_TIMEOUT = int(os.getenv('RECIPE_COUNT_CACHE_TIMEOUT', 0))
+
+# Кеш по умолчанию — память процесса; для общего кеша между воркерами
+# укажите CACHE_BACKEND (например, django_redis.cache.RedisCache)
+# и CACHE_LOCATION
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Кеш ответов API для анонимных пользователей. Без общего CACHE_BACKEND
+# он выключен: сброс версий в памяти одного воркера не виден остальным.
+# RESPONSE_CACHE_ENABLED=1/0 включает или выключает его явно
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_ENABLED = {'1': True, '0': False}.get(
+    os.getenv('RESPONSE_CACHE_ENABLED', ''))
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+# Потоки фоновой обработки изображений рецептов
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Время жизни индекса ингредиент -> рецепты в памяти процесса, секунды
+RECIPE_INDEX_TTL = int(os.getenv('RECIPE_INDEX_TTL', 300))
+
+# Порог числа SQL-запросов на запрос, после которого в лог пишется
+# предупреждение с повторяющимися запросами (поиск N+1)
+METRICS_QUERY_BUDGET = int(os.getenv('METRICS_QUERY_BUDGET', 30))
+
+# Ответы API от этого размера, байт, сжимаются brotli (если установлен
+# пакет Brotli) или gzip; потоковые выгрузки сжимаются всегда
+RESPONSE_COMPRESSION_MIN_SIZE = int(
+    os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 1024))
+RESPONSE_BROTLI_QUALITY = int(os.getenv('RESPONSE_BROTLI_QUALITY', 5))
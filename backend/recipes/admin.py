@@ -24,7 +24,7 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = IngredientsInRecipe,
 
     def get_favorites(self, obj):
-        return obj.favorite_recipe.count()
+        return obj.favorites_count
 
     def get_tags(self, obj):
         return '\n'.join(obj.tags.values_list('name', flat=True))
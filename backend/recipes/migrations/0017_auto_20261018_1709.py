@@ -0,0 +1,67 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:09
+
+from django.contrib.postgres.search import SearchVector
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX recipe_search_vector_idx ON recipes_recipe '
+            'USING gin (search_vector)')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE recipes_recipe_fts '
+            'USING fts5(name, body)')
+    names = {}
+    for recipe_id, name in IngredientInRecipe.objects.values_list(
+            'recipe_id', 'ingredient__name'):
+        names.setdefault(recipe_id, []).append(name)
+    for recipe_id, name, text in Recipe.objects.values_list(
+            'id', 'name', 'text').iterator():
+        search_text = ' '.join((text, *names.get(recipe_id, ())))
+        Recipe.objects.filter(pk=recipe_id).update(search_text=search_text)
+        if vendor == 'sqlite':
+            schema_editor.execute(
+                'INSERT INTO recipes_recipe_fts (rowid, name, body) '
+                'VALUES (%s, %s, %s)', (recipe_id, name, search_text))
+    if vendor == 'postgresql':
+        vector = None
+        for config in ('russian', 'english'):
+            for field, weight in (('name', 'A'), ('search_text', 'B')):
+                part = SearchVector(field, config=config, weight=weight)
+                vector = part if vector is None else vector + part
+        Recipe.objects.update(search_vector=vector)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX recipe_search_vector_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE recipes_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_tags_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_text',
+            field=models.TextField(blank=True, default='', verbose_name='description and ingredients for search'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
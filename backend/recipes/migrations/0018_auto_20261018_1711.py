@@ -0,0 +1,47 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:11
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keep=Min('id'), total=Count('id')
+    ).filter(total__gt=1).order_by()
+    for duplicate in duplicates:
+        extra = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        ).exclude(pk=duplicate['keep'])
+        for row in IngredientInRecipe.objects.filter(ingredient__in=extra):
+            # Ингредиент уже есть в рецепте под оставляемым id:
+            # количества складываются, чтобы не потерять их.
+            if IngredientInRecipe.objects.filter(
+                    recipe_id=row.recipe_id,
+                    ingredient_id=duplicate['keep'],
+            ).update(amount=F('amount') + row.amount):
+                row.delete()
+            else:
+                row.ingredient_id = duplicate['keep']
+                row.save(update_fields=['ingredient'])
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_auto_20261018_1709'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_ingredients,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 
@@ -13,6 +14,12 @@ class Ingredient(models.Model):
 
     class Meta:
         ordering = ('name',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -35,6 +42,8 @@ class Recipe(models.Model):
                                related_name='recipes',
                                verbose_name='Author')
     image = models.ImageField(verbose_name='image', upload_to='static/recipe/')
+    image_variants_ready = models.BooleanField(
+        default=False, verbose_name='image thumbnails are ready')
     ingredients = models.ManyToManyField(Ingredient,
                                          through='IngredientInRecipe',
                                          related_name='recipes',
@@ -50,8 +59,22 @@ class Recipe(models.Model):
         )
     )
 
+    favorites_count = models.PositiveIntegerField(
+        default=0, verbose_name='number of favorites')
+    search_text = models.TextField(
+        blank=True, default='',
+        verbose_name='description and ingredients for search')
+    search_vector = SearchVectorField(null=True, editable=False)
+
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-favorites_count', '-pub_date'],
+                         name='recipe_popular_idx'),
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_idx')]
 
     def __str__(self):
         return self.name
@@ -108,6 +131,23 @@ class ShoppingCart(models.Model):
         ]
 
 
+class ShoppingCartIngredient(models.Model):
+    """Суммарное количество ингредиента в корзине пользователя."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='cart_ingredients')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   related_name='cart_totals')
+    amount = models.IntegerField(verbose_name='total amount')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'], name='unique_cart_ingredient'
+            )
+        ]
+
+
 class TagRecipe(models.Model):
     tag = models.ForeignKey(Tag, on_delete=models.CASCADE,
                             related_name='tag_recipe', )
@@ -130,3 +170,19 @@ class Subscribe(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['author', 'user'],
                                     name='unique_sub')]
+
+
+class FeedItem(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='feed')
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='feed_items')
+    pub_date = models.DateTimeField(verbose_name='Date')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_feed_item')]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='feed_user_pub_date_idx')]
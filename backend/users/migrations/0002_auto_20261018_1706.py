@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:06
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counts(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscribe = apps.get_model('recipes', 'Subscribe')
+    for author_id, total in Recipe.objects.values_list(
+            'author').annotate(total=Count('id')).order_by():
+        User.objects.filter(pk=author_id).update(recipes_count=total)
+    for author_id, total in Subscribe.objects.values_list(
+            'author').annotate(total=Count('id')).order_by():
+        User.objects.filter(pk=author_id).update(followers_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('recipes', '0013_auto_20261018_1702'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='number of followers'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='number of recipes'),
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
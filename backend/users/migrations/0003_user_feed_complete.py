@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pull_authors(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    User.objects.filter(
+        followers_count__gt=getattr(settings, 'FEED_FANOUT_LIMIT', 1000)
+    ).update(feed_complete=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20261018_1706'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='feed_complete',
+            field=models.BooleanField(default=True, verbose_name='all recipes are in the followers feeds'),
+        ),
+        migrations.RunPython(mark_pull_authors, migrations.RunPython.noop),
+    ]
@@ -21,6 +21,18 @@ class User(AbstractUser):
         max_length=50,
         verbose_name='surname'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='number of recipes'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='number of followers'
+    )
+    feed_complete = models.BooleanField(
+        default=True,
+        verbose_name='all recipes are in the followers feeds'
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']